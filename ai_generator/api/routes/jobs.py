@@ -0,0 +1,22 @@
+from fastapi import APIRouter, HTTPException, Query
+from schemas.job import JobOut
+from services.job_service import create_generation_job, get_job
+
+job_router = APIRouter()
+
+
+@job_router.post("/stories/generate/jobs", response_model=JobOut, status_code=202)
+def generate_stories_job(count: int = Query(5, ge=1, le=20)):
+    """
+    Start a background job that generates and stores `count` stories.
+    Returns right away; poll GET /jobs/{job_id} for progress.
+    """
+    return create_generation_job(count)
+
+
+@job_router.get("/jobs/{job_id}", response_model=JobOut)
+def get_generation_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
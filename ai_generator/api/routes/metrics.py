@@ -0,0 +1,50 @@
+from fastapi import APIRouter
+from core.generator.llm.backend_pool import get_backend_pool
+from core.generator.llm.context_window import get_context_sizer
+from core.generator.llm.response_cache import get_response_cache
+from core.generator.llm.scheduler import get_llm_scheduler
+from image_generator.comfy_pool import get_comfy_pool
+from services.prefetch_service import page_buffer
+from utilities.write_spool import get_write_spool
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get("/metrics/llm-cache")
+def llm_cache_metrics():
+    return get_response_cache().stats()
+
+
+@metrics_router.get("/metrics/spool")
+def write_spool_metrics():
+    return get_write_spool().stats()
+
+
+@metrics_router.get("/metrics/prefetch")
+def prefetch_metrics():
+    return page_buffer.stats()
+
+
+@metrics_router.get("/metrics/scheduler")
+def llm_scheduler_metrics():
+    return get_llm_scheduler().stats()
+
+
+@metrics_router.get("/metrics/ollama-backends")
+def ollama_backend_metrics():
+    return get_backend_pool().stats()
+
+
+@metrics_router.get("/metrics/hedging")
+def hedging_metrics():
+    return get_backend_pool().hedge_stats()
+
+
+@metrics_router.get("/metrics/context-window")
+def context_window_metrics():
+    return get_context_sizer().stats()
+
+
+@metrics_router.get("/metrics/comfy")
+def comfy_pool_metrics():
+    return get_comfy_pool().stats()
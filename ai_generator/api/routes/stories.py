@@ -1,25 +1,60 @@
-from typing import List
+from typing import List, Union
 from uuid import UUID
-from fastapi import APIRouter, Query
-from schemas.story import FullStoryOut, StoryOut
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from schemas.cover import CoverStatus
+from schemas.story import FullStoryOut, StoryBatchOut, StoryOut
+from services.cover_service import get_cover_status
 from services.story_service import (
     generate_and_store_next_page,
     generate_and_store_stories,
+    stream_and_store_next_page,
 )
 
 story_router = APIRouter()
 
 
-@story_router.post("/stories/generate", response_model=List[StoryOut])
-def generate_stories(count: int = Query(5, ge=1, le=20)):
+@story_router.post(
+    "/stories/generate", response_model=Union[List[StoryOut], StoryBatchOut]
+)
+def generate_stories(
+    count: int = Query(5, ge=1, le=20), batch: bool = Query(False)
+):
     """
     Generate and store AI-generated stories using Ollama + LangChain.
     Defaults to 5 stories. Max 20.
+    With batch=true, stories are generated stage by stage grouped by model,
+    and the response also carries the model-swap report.
     """
-    return generate_and_store_stories(count)
+    stories, report = generate_and_store_stories(count, batch=batch)
+    if batch:
+        return StoryBatchOut(stories=stories, report=report)
+    return stories
 
 
 
 @story_router.get("/stories/generate/new_page/{story_id}", response_model=str)
 def generate_new_page_for_story(story_id: UUID):
     return generate_and_store_next_page(story_id)
+
+
+@story_router.get("/stories/generate/new_page/{story_id}/stream")
+def stream_new_page_for_story(story_id: UUID):
+    """
+    Same as the new_page endpoint, but streams stage progress and the final
+    page text as server-sent events while it is generated.
+    """
+    return StreamingResponse(
+        stream_and_store_next_page(story_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@story_router.get("/stories/{story_id}/cover", response_model=CoverStatus)
+def get_story_cover_status(story_id: UUID):
+    """Status of the background cover render for a story created by this process."""
+    cover = get_cover_status(str(story_id))
+    if cover is None:
+        raise HTTPException(status_code=404, detail="No cover render for this story")
+    return cover
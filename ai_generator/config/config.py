@@ -11,5 +11,140 @@ class Settings:
     SUPABASE_SERVICE_KEY: Optional[str] = os.getenv("SUPABASE_SERVICE_KEY")
     APP_PORT: Optional[int] = int(os.getenv("APP_PORT"))
 
+    # Max pipeline stages run at the same time for one story
+    PIPELINE_MAX_CONCURRENCY: int = int(os.getenv("PIPELINE_MAX_CONCURRENCY", "2"))
+
+    # Background generation jobs
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_RETENTION_SECONDS: int = int(os.getenv("JOB_RETENTION_SECONDS", "86400"))
+
+    # Shared Ollama HTTP clients
+    OLLAMA_BASE_URL: Optional[str] = os.getenv("OLLAMA_BASE_URL")
+    OLLAMA_POOL_SIZE: int = int(os.getenv("OLLAMA_POOL_SIZE", "10"))
+    OLLAMA_HTTP_KEEPALIVE_SECONDS: float = float(
+        os.getenv("OLLAMA_HTTP_KEEPALIVE_SECONDS", "120")
+    )
+    # Ollama hosts as "url=model,model;url"; a host without models serves all.
+    # Unset means OLLAMA_BASE_URL only.
+    OLLAMA_BACKENDS: str = os.getenv("OLLAMA_BACKENDS", "")
+    OLLAMA_HEALTH_CHECK_SECONDS: float = float(
+        os.getenv("OLLAMA_HEALTH_CHECK_SECONDS", "15")
+    )
+    OLLAMA_CIRCUIT_FAILURES: int = int(os.getenv("OLLAMA_CIRCUIT_FAILURES", "3"))
+    OLLAMA_CIRCUIT_RESET_SECONDS: float = float(
+        os.getenv("OLLAMA_CIRCUIT_RESET_SECONDS", "30")
+    )
+    # Hedging of short calls to a second host once they run past a percentile
+    OLLAMA_HEDGING: bool = os.getenv("OLLAMA_HEDGING", "false").lower() == "true"
+    OLLAMA_HEDGE_PERCENTILE: float = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "95"))
+    # Max hedges as a fraction of hedgeable calls
+    OLLAMA_HEDGE_BUDGET: float = float(os.getenv("OLLAMA_HEDGE_BUDGET", "0.05"))
+    OLLAMA_HEDGE_MIN_SAMPLES: int = int(os.getenv("OLLAMA_HEDGE_MIN_SAMPLES", "20"))
+    # How long Ollama keeps a model loaded after a request, e.g. "10m"
+    OLLAMA_KEEP_ALIVE: Optional[str] = os.getenv("OLLAMA_KEEP_ALIVE")
+
+    # On-disk cache for deterministic LLM calls
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+    LLM_CACHE_MAX_BYTES: int = int(os.getenv("LLM_CACHE_MAX_BYTES", "268435456"))
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", "604800"))
+
+    # Sentence embeddings; set EMBEDDING_SERVICE_URL to use a shared server
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    EMBEDDING_SERVICE_URL: Optional[str] = os.getenv("EMBEDDING_SERVICE_URL")
+    EMBEDDING_SERVICE_PORT: int = int(os.getenv("EMBEDDING_SERVICE_PORT", "5100"))
+    EMBEDDING_BATCH_WAIT_MS: float = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "10"))
+    EMBEDDING_MAX_BATCH: int = int(os.getenv("EMBEDDING_MAX_BATCH", "64"))
+    EMBEDDING_CACHE_SIZE: int = int(os.getenv("EMBEDDING_CACHE_SIZE", "1024"))
+
+    # Background story-state writes after a page is stored
+    STATE_WRITER_WORKERS: int = int(os.getenv("STATE_WRITER_WORKERS", "4"))
+    STATE_FLUSH_TIMEOUT_SECONDS: float = float(
+        os.getenv("STATE_FLUSH_TIMEOUT_SECONDS", "300")
+    )
+    # How long a request that lost the claim on a page number waits for the
+    # winner's page before giving up
+    PAGE_CLAIM_WAIT_SECONDS: float = float(os.getenv("PAGE_CLAIM_WAIT_SECONDS", "120"))
+
+    # Local spool for Supabase writes that fail while it is unavailable. Each
+    # process spools to its own file, named after this path plus its pid.
+    WRITE_SPOOL_PATH: str = os.getenv("WRITE_SPOOL_PATH", "write_spool.jsonl")
+    WRITE_SPOOL_BATCH_SIZE: int = int(os.getenv("WRITE_SPOOL_BATCH_SIZE", "50"))
+    WRITE_SPOOL_MAX_BACKOFF_SECONDS: float = float(
+        os.getenv("WRITE_SPOOL_MAX_BACKOFF_SECONDS", "60")
+    )
+
+    # ComfyUI servers as "host:port,host:port"; renders go to the shortest queue
+    COMFY_SERVERS: str = os.getenv("COMFY_SERVERS", "127.0.0.1:8000")
+    COMFY_TIMEOUT_SECONDS: float = float(os.getenv("COMFY_TIMEOUT_SECONDS", "300"))
+    COMFY_SERVER_RETRY_SECONDS: float = float(
+        os.getenv("COMFY_SERVER_RETRY_SECONDS", "30")
+    )
+    # /queue probes choosing a server; a slow one is skipped, not waited on
+    COMFY_PROBE_TIMEOUT_SECONDS: float = float(
+        os.getenv("COMFY_PROBE_TIMEOUT_SECONDS", "5")
+    )
+    # Receive ComfyUI images as websocket frames (needs SaveImageWebsocket)
+    COMFY_WEBSOCKET_IMAGES: bool = (
+        os.getenv("COMFY_WEBSOCKET_IMAGES", "false").lower() == "true"
+    )
+
+    # Background cover rendering after a story is stored
+    COVER_WORKERS: int = int(os.getenv("COVER_WORKERS", "1"))
+    # Max covers rendered as one pipelined ComfyUI batch; 1 disables batching
+    COVER_BATCH_SIZE: int = int(os.getenv("COVER_BATCH_SIZE", "4"))
+    # How long a worker waits for a full batch before rendering what is queued
+    COVER_BATCH_LINGER_SECONDS: float = float(
+        os.getenv("COVER_BATCH_LINGER_SECONDS", "2")
+    )
+    COVER_MAX_ATTEMPTS: int = int(os.getenv("COVER_MAX_ATTEMPTS", "3"))
+    COVER_RETRY_BACKOFF_SECONDS: float = float(
+        os.getenv("COVER_RETRY_BACKOFF_SECONDS", "5")
+    )
+    # How long finished cover statuses stay readable at /stories/{id}/cover
+    COVER_RETENTION_SECONDS: int = int(os.getenv("COVER_RETENTION_SECONDS", "3600"))
+    # Downscaled WebP/AVIF covers stored in stories.cover_image_variants (jsonb)
+    COVER_VARIANTS: bool = os.getenv("COVER_VARIANTS", "false").lower() == "true"
+    COVER_VARIANT_FORMAT: str = os.getenv("COVER_VARIANT_FORMAT", "webp")
+    COVER_VARIANT_WIDTHS: str = os.getenv("COVER_VARIANT_WIDTHS", "480,320")
+    COVER_THUMBNAIL_WIDTH: int = int(os.getenv("COVER_THUMBNAIL_WIDTH", "160"))
+
+    # Best-of-N candidate generation for continuation drafts and finals
+    CANDIDATE_COUNT: int = int(os.getenv("CANDIDATE_COUNT", "3"))
+    CANDIDATE_MAX_ROUNDS: int = int(os.getenv("CANDIDATE_MAX_ROUNDS", "2"))
+    CANDIDATE_TIMEOUT_SECONDS: float = float(
+        os.getenv("CANDIDATE_TIMEOUT_SECONDS", "600")
+    )
+    # Extra wait for a first candidate when none finished by the timeout
+    CANDIDATE_GRACE_SECONDS: float = float(os.getenv("CANDIDATE_GRACE_SECONDS", "60"))
+
+    # Next pages generated ahead for stories with recent readers; 0 disables
+    PREFETCH_PAGES_AHEAD: int = int(os.getenv("PREFETCH_PAGES_AHEAD", "0"))
+    PREFETCH_GPU_SECONDS_PER_HOUR: float = float(
+        os.getenv("PREFETCH_GPU_SECONDS_PER_HOUR", "1800")
+    )
+    PREFETCH_IDLE_SECONDS: float = float(os.getenv("PREFETCH_IDLE_SECONDS", "1800"))
+    # How long a reader waits for a page still being prefetched before it is
+    # cancelled and generated inline
+    PREFETCH_WAIT_SECONDS: float = float(os.getenv("PREFETCH_WAIT_SECONDS", "120"))
+
+    # num_ctx buckets picked per call from the prompt size plus expected output.
+    # Each change reloads the model, so keep them coarse; per-model lists go in
+    # LLM_MODEL_CTX_BUCKETS as "gemma3:12b=8192,16384;llama3=4096".
+    LLM_CTX_BUCKETS: str = os.getenv("LLM_CTX_BUCKETS", "4096,16384,32768")
+    LLM_MODEL_CTX_BUCKETS: str = os.getenv("LLM_MODEL_CTX_BUCKETS", "")
+    # Calls in a row that fit a smaller bucket before a model moves down to it
+    LLM_CTX_SHRINK_AFTER: int = int(os.getenv("LLM_CTX_SHRINK_AFTER", "20"))
+    LLM_DEFAULT_OUTPUT_TOKENS: int = int(os.getenv("LLM_DEFAULT_OUTPUT_TOKENS", "1024"))
+    # Starting estimate before it is calibrated from Ollama's token counts
+    LLM_BYTES_PER_TOKEN: float = float(os.getenv("LLM_BYTES_PER_TOKEN", "3.5"))
+
+    # LLM call scheduling: per-model concurrency, e.g. "gemma3:12b=1,llama3=2"
+    LLM_MODEL_CONCURRENCY: str = os.getenv("LLM_MODEL_CONCURRENCY", "")
+    LLM_DEFAULT_CONCURRENCY: int = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "2"))
+    # Seconds of queueing that move a waiting call up one priority class
+    LLM_PRIORITY_AGING_SECONDS: float = float(
+        os.getenv("LLM_PRIORITY_AGING_SECONDS", "30")
+    )
+
 
 settings = Settings()
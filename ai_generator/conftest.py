@@ -0,0 +1,7 @@
+import os
+import sys
+
+# Modules import each other from this directory (e.g. `from config.config`),
+# as they do when the app runs from here.
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("APP_PORT", "8000")
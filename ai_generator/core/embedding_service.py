@@ -0,0 +1,226 @@
+"""
+Sentence embeddings for similarity checks.
+
+The model is loaded on first use, not at import. Concurrent encode calls are
+merged into one forward pass. Several uvicorn workers can share one loaded
+model by running this module as a server:
+
+    python -m core.embedding_service
+
+and pointing the workers at it with EMBEDDING_SERVICE_URL.
+"""
+
+import hashlib
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Optional, Union
+
+import httpx
+import numpy as np
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from config.config import settings
+
+
+class LocalEmbeddingService:
+    """Loads the model lazily and batches concurrent encode requests."""
+
+    def __init__(self, model_name: str, batch_wait_ms: float, max_batch: int):
+        self.model_name = model_name
+        self.batch_wait = batch_wait_ms / 1000
+        self.max_batch = max_batch
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._requests: "queue.Queue[tuple]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                from sentence_transformers import SentenceTransformer
+
+                self._model = SentenceTransformer(self.model_name)
+            return self._model
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            size = len(batch[0][0])
+            while size < self.max_batch:
+                try:
+                    item = self._requests.get(timeout=self.batch_wait)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[0])
+
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                embeddings = self._get_model().encode(
+                    texts, convert_to_numpy=True, normalize_embeddings=True
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(embeddings[offset : offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Return L2-normalised embeddings, one row per text."""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        self._ensure_worker()
+        future: Future = Future()
+        self._requests.put((list(texts), future))
+        return future.result()
+
+
+class RemoteEmbeddingService:
+    """Client for an embedding server started from this module."""
+
+    def __init__(self, url: str):
+        self._client = httpx.Client(base_url=url, timeout=60.0)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        response = self._client.post("/encode", json={"texts": list(texts)})
+        response.raise_for_status()
+        return np.asarray(response.json()["embeddings"], dtype=np.float32)
+
+
+class EmbeddingCache:
+    """
+    LRU cache of embeddings keyed by the SHA-256 of the text. Misses from one
+    call are encoded together in a single request to the underlying service.
+    """
+
+    def __init__(self, service, max_entries: int):
+        self.service = service
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        keys = [self._key(text) for text in texts]
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+
+        if missing:
+            embeddings = self.service.encode(list(missing.values()))
+            found.update(zip(missing.keys(), embeddings))
+            with self._lock:
+                for key in missing:
+                    self._entries[key] = found[key]
+                    self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+        with self._lock:
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+
+        return np.stack([found[key] for key in keys])
+
+
+def cosine_similarity_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise cosine similarities between the rows of `a` and `b`."""
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return a @ b.T
+
+
+_service: Optional[Union[LocalEmbeddingService, RemoteEmbeddingService]] = None
+_service_lock = threading.Lock()
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_service() -> Union[LocalEmbeddingService, RemoteEmbeddingService]:
+    global _service
+
+    with _service_lock:
+        if _service is None:
+            if settings.EMBEDDING_SERVICE_URL:
+                _service = RemoteEmbeddingService(settings.EMBEDDING_SERVICE_URL)
+            else:
+                _service = LocalEmbeddingService(
+                    settings.EMBEDDING_MODEL,
+                    batch_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+                    max_batch=settings.EMBEDDING_MAX_BATCH,
+                )
+        return _service
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _cache
+
+    service = get_embedding_service()
+    with _service_lock:
+        if _cache is None:
+            _cache = EmbeddingCache(service, max_entries=settings.EMBEDDING_CACHE_SIZE)
+        return _cache
+
+
+class EncodeRequest(BaseModel):
+    texts: List[str]
+
+
+def create_embedding_app() -> FastAPI:
+    """
+    The standalone embedding server: a local model behind POST /encode. Only
+    built when this module runs as a script, so importing the client side
+    never creates a server app or a local model.
+    """
+    app = FastAPI()
+    service = LocalEmbeddingService(
+        settings.EMBEDDING_MODEL,
+        batch_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+        max_batch=settings.EMBEDDING_MAX_BATCH,
+    )
+
+    @app.post("/encode")
+    def encode_texts(request: EncodeRequest):
+        return {"embeddings": service.encode(request.texts).tolist()}
+
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        create_embedding_app(),
+        host="127.0.0.1",
+        port=settings.EMBEDDING_SERVICE_PORT,
+    )
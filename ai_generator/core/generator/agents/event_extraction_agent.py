@@ -4,7 +4,14 @@ from langchain_core.output_parsers import JsonOutputParser
 
 
 def extract_story_events_from_text(content: str, model_name: str = "mistral") -> list:
-    llm = get_ollama(model=model_name, temperature=0.2, top_p=0.7, verbose=False)
+    llm = get_ollama(
+        model=model_name,
+        temperature=0.2,
+        top_p=0.7,
+        verbose=False,
+        cache=True,
+        hedge="story_events",
+    )
     prompt = event_extraction_prompt()
     chain = prompt | llm | JsonOutputParser()
 
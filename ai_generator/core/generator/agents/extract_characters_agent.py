@@ -8,7 +8,12 @@ from langchain_core.output_parsers import JsonOutputParser
 
 def extract_character_data(sketch: str, model_name: str = "mistral"):
     llm = get_ollama(
-        model=model_name, temperature=0.1, top_p=3, format="json", verbose=False
+        model=model_name,
+        temperature=0.1,
+        top_p=3,
+        format="json",
+        verbose=False,
+        cache=True,
     )
     prompt = extract_character_prompt()
     try:
@@ -22,7 +27,12 @@ def extract_character_data(sketch: str, model_name: str = "mistral"):
 
 def extract_new_character_data(sketch: str, model_name: str = "mistral"):
     llm = get_ollama(
-        model=model_name, temperature=0.3, top_p=3, format="json", verbose=False
+        model=model_name,
+        temperature=0.3,
+        top_p=3,
+        format="json",
+        verbose=False,
+        cache=True,
     )
     prompt = extract_new_character_prompt()
     try:
@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, Iterator, List
 from langchain_core.output_parsers import StrOutputParser
 from core.generator.agents.metadata_extraction_agent import extract_story_metadata
 from core.generator.agents.title_agent import generate_title
@@ -9,14 +9,12 @@ from core.generator.prompt.final_story import (
 )
 
 
-def generate_final_story(
-    genre: str,
-    tone: str,
+def generate_final_story_text(
     sketch_text: str,
     draft_text: str,
     critique_text: str,
     model_used: str = "gemma3",
-) -> dict:
+) -> str:
     try:
         llm = get_ollama(
             model=model_used,
@@ -24,7 +22,7 @@ def generate_final_story(
             verbose=False,
             top_k=30,
             top_p=0.8,
-            num_ctx=10000,
+            output_tokens=2048,
         )
     except:
         llm = get_ollama(model="llama3")
@@ -32,14 +30,22 @@ def generate_final_story(
     prompt = final_story_prompt()
     chain = prompt | llm | StrOutputParser()
 
-    final_story = chain.invoke(
+    return chain.invoke(
         {"sketch": sketch_text, "draft": draft_text, "critique": critique_text}
     ).strip()
 
-    # Try extracting title, genre, tone from sketch if present
-    title = generate_title(final_story)
 
-    story_metadata = {
+def build_story_metadata(
+    genre: str,
+    tone: str,
+    title: str,
+    final_story: str,
+    sketch_text: str,
+    draft_text: str,
+    critique_text: str,
+    model_used: str = "gemma3",
+) -> dict:
+    return {
         "title": title.strip('"') or final_story[:100].split(".")[0],
         "genre": genre,
         "tone": tone,
@@ -48,7 +54,7 @@ def generate_final_story(
         "current_page_number": 1,
         "story_type": "short",
         "model_used": model_used,
-        "seed_prompt": prompt.format(
+        "seed_prompt": final_story_prompt().format(
             sketch=sketch_text, draft=draft_text, critique=critique_text
         ),
         "current_status": None,  # You can optionally add a summary agent here
@@ -56,6 +62,33 @@ def generate_final_story(
         "is_final_chapter": False,
     }
 
+
+def generate_final_story(
+    genre: str,
+    tone: str,
+    sketch_text: str,
+    draft_text: str,
+    critique_text: str,
+    model_used: str = "gemma3",
+) -> dict:
+    final_story = generate_final_story_text(
+        sketch_text, draft_text, critique_text, model_used=model_used
+    )
+
+    # Try extracting title, genre, tone from sketch if present
+    title = generate_title(final_story)
+
+    story_metadata = build_story_metadata(
+        genre=genre,
+        tone=tone,
+        title=title,
+        final_story=final_story,
+        sketch_text=sketch_text,
+        draft_text=draft_text,
+        critique_text=critique_text,
+        model_used=model_used,
+    )
+
     return {"metadata": story_metadata, "content": final_story}
 
 
@@ -66,13 +99,7 @@ def extract_field_from_sketch(field: str, sketch: str) -> str:
     return ""
 
 
-def generate_final_story_for_continuation(
-    context: str,
-    draft_text: str,
-    critique_text: str,
-    character_context: str,
-    model: str = "gemma3",
-) -> dict:
+def final_continuation_chain(model: str = "gemma3"):
     try:
         llm = get_ollama(
             model=model,
@@ -80,13 +107,23 @@ def generate_final_story_for_continuation(
             verbose=False,
             top_k=30,
             top_p=0.8,
-            num_ctx=10000,
+            output_tokens=2048,
         )
     except:
         llm = get_ollama(model="llama3")
 
     prompt = final_continuation_prompt()
-    chain = prompt | llm | StrOutputParser()
+    return prompt, prompt | llm | StrOutputParser()
+
+
+def generate_final_story_for_continuation(
+    context: str,
+    draft_text: str,
+    critique_text: str,
+    character_context: str,
+    model: str = "gemma3",
+) -> dict:
+    prompt, chain = final_continuation_chain(model)
 
     final_story = chain.invoke(
         {
@@ -105,3 +142,23 @@ def generate_final_story_for_continuation(
             character_context=character_context,
         ),
     }
+
+
+def stream_final_story_for_continuation(
+    context: str,
+    draft_text: str,
+    critique_text: str,
+    character_context: str,
+    model: str = "gemma3",
+) -> Iterator[str]:
+    """Yield the final continuation text chunk by chunk as Ollama produces it."""
+    _, chain = final_continuation_chain(model)
+
+    yield from chain.stream(
+        {
+            "context": context,
+            "draft": draft_text,
+            "critique": critique_text,
+            "character_context": character_context,
+        }
+    )
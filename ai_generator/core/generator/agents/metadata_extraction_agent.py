@@ -7,7 +7,14 @@ from core.generator.prompt.helpers import metadata_extraction_prompt
 def extract_story_metadata(
     sketch: str, story_text: str, model_name: str = "mistral"
 ) -> dict:
-    llm = get_ollama(model=model_name, temperature=0.2, top_p=1, verbose=False)
+    llm = get_ollama(
+        model=model_name,
+        temperature=0.2,
+        top_p=1,
+        verbose=False,
+        cache=True,
+        hedge="story_metadata",
+    )
     prompt = metadata_extraction_prompt()
     chain = prompt | llm | JsonOutputParser()
 
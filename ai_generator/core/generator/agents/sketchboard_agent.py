@@ -30,9 +30,7 @@ def generate_sketchboard_for_continuation(
     model: str = "gemma3:12b",
 ) -> str:
     names = fetch_random_names(2)
-    llm = get_ollama(
-        model=model, temperature=0.9, verbose=False, top_k=35, num_ctx=10000
-    )
+    llm = get_ollama(model=model, temperature=0.9, verbose=False, top_k=35)
     prompt = sketchboard_prompt_for_continuation()
     chain = prompt | llm | StrOutputParser()
     sketch_text = chain.invoke(
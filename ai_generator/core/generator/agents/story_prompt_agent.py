@@ -15,7 +15,7 @@ def generate_draft_story(sketch_text: str, model_used: str = "gemma3:12b") -> st
         verbose=False,
         top_k=40,
         top_p=0.8,
-        num_ctx=10000,
+        output_tokens=2048,
     )
     prompt = story_draft_prompt()
     chain = prompt | llm | StrOutputParser()
@@ -27,7 +27,12 @@ def generate_draft_story_for_continuation(
     sketch_text: str, context: str, rules: str, model: str = "gemma3:12b"
 ) -> str:
     llm = get_ollama(
-        model=model, temperature=1.5, verbose=False, top_k=50, top_p=0.95, num_ctx=10000
+        model=model,
+        temperature=1.5,
+        verbose=False,
+        top_k=50,
+        top_p=0.95,
+        output_tokens=2048,
     )
     prompt = story_draft_prompt_for_continuation()
     chain = prompt | llm | StrOutputParser()
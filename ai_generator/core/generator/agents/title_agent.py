@@ -5,7 +5,13 @@ from langchain_core.output_parsers import StrOutputParser
 
 def generate_title(story: str, model_name: str = "llama3") -> str:
     llm = get_ollama(
-        model=model_name, temperature=2.0, verbose=False, top_k=40, top_p=1.1
+        model=model_name,
+        temperature=2.0,
+        verbose=False,
+        top_k=40,
+        top_p=1.1,
+        hedge="title",
+        output_tokens=64,
     )
     prompt = title_prompt()
     chain = prompt | llm | StrOutputParser()
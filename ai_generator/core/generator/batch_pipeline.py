@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.constants.helper import random_genre, random_tone
+from core.generator.stages import Stage, assemble_full_story, full_story_stages
+
+
+def count_model_swaps(models: List[str]) -> int:
+    """Number of times the loaded Ollama model changes over a call sequence."""
+    return sum(1 for prev, cur in zip(models, models[1:]) if prev != cur)
+
+
+def plan_stage_order(stages: List[Stage]) -> List[Stage]:
+    """
+    Order stages so that every stage runs after its dependencies and, among
+    the stages that are ready, the one on the currently loaded model goes first.
+    """
+    done = set()
+    pending = list(stages)
+    order = []
+    resident: Optional[str] = None
+
+    while pending:
+        ready = [s for s in pending if all(n in done for n in s["needs"])]
+        if not ready:
+            raise ValueError(
+                f"Unresolvable stage dependencies: {[s['name'] for s in pending]}"
+            )
+        same_model = [s for s in ready if s["model"] == resident]
+        stage = same_model[0] if same_model else ready[0]
+
+        order.append(stage)
+        done.add(stage["name"])
+        pending.remove(stage)
+        resident = stage["model"]
+
+    return order
+
+
+def generate_full_story_batch(
+    count: int, model_used: str = "llama3"
+) -> Tuple[List[Tuple[Dict[str, Any], Any, str, str, str]], Dict[str, Any]]:
+    """
+    Generate `count` first pages stage by stage instead of story by story:
+    each stage runs for every story back to back before the next stage starts,
+    with stages grouped by model so Ollama swaps models as rarely as possible.
+
+    Returns the per-story pipeline tuples (same shape as
+    generate_full_story_pipeline) and a report of the model swaps avoided.
+    """
+    stages = full_story_stages(model_used)
+    order = plan_stage_order(stages)
+
+    states = [{"genre": random_genre(), "tone": random_tone()} for _ in range(count)]
+    failed = set()
+
+    for stage in order:
+        print(f"[batch] Stage '{stage['name']}' on {stage['model']} x{count}")
+        for i, state in enumerate(states):
+            if i in failed:
+                continue
+            try:
+                state[stage["name"]] = stage["run"](state)
+            except Exception as e:
+                print(f"[batch] Story {i} failed at '{stage['name']}': {e}")
+                failed.add(i)
+
+    results = [
+        assemble_full_story(state, model_used=model_used)
+        for i, state in enumerate(states)
+        if i not in failed
+    ]
+
+    sequential_models = [s["model"] for _ in range(count) for s in stages]
+    batched_models = [s["model"] for s in order for _ in range(count)]
+    sequential_swaps = count_model_swaps(sequential_models)
+    batched_swaps = count_model_swaps(batched_models)
+
+    report = {
+        "stories_requested": count,
+        "stories_generated": len(results),
+        "stage_order": [s["name"] for s in order],
+        "sequential_model_swaps": sequential_swaps,
+        "batched_model_swaps": batched_swaps,
+        "model_swaps_avoided": sequential_swaps - batched_swaps,
+    }
+    print(f"[batch] {report}")
+
+    return results, report
@@ -0,0 +1,105 @@
+import contextvars
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from config.config import settings
+from core.generator.llm.ollama_llm import llm_cancel_event
+from utilities.utils import score_similarities
+
+T = TypeVar("T")
+
+
+def window_distance(similarity: float, lt: float, ut: float) -> float:
+    """
+    Ranking key for a similarity score, lower is better: in-range scores rank
+    by distance to the window centre, out-of-range scores always rank after.
+    """
+    if lt < similarity < ut:
+        return abs(similarity - (lt + ut) / 2)
+    return (ut - lt) + min(abs(similarity - lt), abs(similarity - ut))
+
+
+def generate_best_candidate(
+    generate: Callable[[], T],
+    reference: str,
+    lt: float,
+    ut: float,
+    text_of: Callable[[T], str] = lambda candidate: candidate,
+    n: Optional[int] = None,
+    max_rounds: Optional[int] = None,
+    timeout: Optional[float] = None,
+) -> Tuple[T, float]:
+    """
+    Generate `n` candidates concurrently, score them against `reference` in
+    one batch and return the best one with its similarity. A round where no
+    candidate lands inside (lt, ut) is retried up to `max_rounds` times;
+    `timeout` caps the total wall clock, after which the best candidate seen
+    so far is returned and the LLM calls still running are cancelled. With no
+    candidate yet, the first to finish within CANDIDATE_GRACE_SECONDS more is
+    used; otherwise the calls are cancelled and TimeoutError is raised.
+
+    Ollama has no multi-sample option on /api/generate, so the N samples are
+    separate concurrent requests (served in parallel with OLLAMA_NUM_PARALLEL).
+    """
+    n = n or settings.CANDIDATE_COUNT
+    max_rounds = max_rounds or settings.CANDIDATE_MAX_ROUNDS
+    timeout = timeout or settings.CANDIDATE_TIMEOUT_SECONDS
+    deadline = time.monotonic() + timeout
+
+    best: Optional[Tuple[T, float]] = None
+
+    for round_number in range(1, max_rounds + 1):
+        cancel = threading.Event()
+
+        def run() -> T:
+            with llm_cancel_event(cancel):
+                return generate()
+
+        pool = ThreadPoolExecutor(max_workers=n)
+        futures = [pool.submit(contextvars.copy_context().run, run) for _ in range(n)]
+
+        done, _ = wait(futures, timeout=max(deadline - time.monotonic(), 0))
+        if not done and best is None:
+            # Nothing to fall back on yet: wait a bounded grace period for one
+            done, _ = wait(
+                futures,
+                timeout=settings.CANDIDATE_GRACE_SECONDS,
+                return_when=FIRST_COMPLETED,
+            )
+        # Stragglers would otherwise keep their Ollama slots past the deadline
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+        if not done and best is None:
+            raise TimeoutError(
+                f"No candidate finished within {timeout:.0f}s plus "
+                f"{settings.CANDIDATE_GRACE_SECONDS:.0f}s grace"
+            )
+
+        candidates: List[T] = []
+        for future in done:
+            try:
+                candidates.append(future.result())
+            except Exception as e:
+                print(f"Candidate generation failed: {e}")
+
+        if candidates:
+            scores = score_similarities(reference, [text_of(c) for c in candidates])
+            print(f"Round {round_number} similarity scores: {scores}")
+            for candidate, score in zip(candidates, scores):
+                if best is None or window_distance(score, lt, ut) < window_distance(
+                    best[1], lt, ut
+                ):
+                    best = (candidate, score)
+
+        if best is not None and lt < best[1] < ut:
+            break
+        if time.monotonic() >= deadline:
+            print("Candidate generation hit its time limit")
+            break
+
+    if best is None:
+        raise RuntimeError("All candidate generations failed")
+    return best
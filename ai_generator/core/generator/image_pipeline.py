@@ -1,68 +1,202 @@
 import random
 import json
 import io
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple, Union
 from PIL import Image
-from image_generator.tester import ComfyClient
+from config.config import settings
+from image_generator.comfy_pool import get_comfy_pool
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# ComfyUI's SaveImage writes the prompt and workflow into these chunks
+PNG_TEXT_CHUNKS = {b"tEXt", b"iTXt", b"zTXt"}
+
+NEGATIVE_PROMPT = "nudity, nsfw, bad anatomy, extra limbs, bad hands, malformed hands, poorly drawn hands, poorly drawn feet, missing fingers, extra fingers, fused fingers, bad feet, deformed, disfigured, low quality, bad proportions, text, watermark, signature, error, jpeg artifacts, worst quality, lowres, low resolution"
 
-def generate_and_upload_cover_image_to_supabase(
-    prompt_text: str,
-    supabase_client,
-    bucket_name: str,
-    story_id: str,
-    workflow_file: str = "workflow.json",
-    server: str = "127.0.0.1:8000"
-) -> str:
-    """
-    Generates a single cover image for the given prompt,
-    uploads it to Supabase Storage, and returns the public URL.
-    """
 
-    # Load workflow template
+def build_cover_workflow(
+    prompt_text: str, workflow_file: str = "workflow.json"
+) -> Tuple[dict, int]:
+    """Load the workflow template and fill in the prompts and a random seed."""
     with open(workflow_file, "r", encoding="utf-8") as f:
         workflow = json.load(f)
 
-    # Customize prompt and seed
     workflow["4"]["inputs"]["text"] = f"""
     {prompt_text}
 
     Leave the top area with less content for text integration.
     """
-    workflow["10"]["inputs"]["text"] = "nudity, nsfw, bad anatomy, extra limbs, bad hands, malformed hands, poorly drawn hands, poorly drawn feet, missing fingers, extra fingers, fused fingers, bad feet, deformed, disfigured, low quality, bad proportions, text, watermark, signature, error, jpeg artifacts, worst quality, lowres, low resolution"
+    workflow["10"]["inputs"]["text"] = NEGATIVE_PROMPT
     seed = random.randint(1, 1_000_000_000)
 
-    workflow["3"]["inputs"]["seed"] = seed
+    for node in workflow.values():
+        if node["class_type"] == "KSampler":
+            node["inputs"]["seed"] = seed
 
-    # Generate images from Comfy
-    client = ComfyClient(server)
-    images_by_node = client.generate_images(workflow)
+    return workflow, seed
 
+
+def first_image(images_by_node: dict) -> bytes:
     # We'll only take the first image generated
-    first_image_bytes = None
     for image_list in images_by_node.values():
         if image_list:
-            first_image_bytes = image_list[0]
-            break
+            return image_list[0]
+    raise Exception("No image was generated by ComfyUI")
+
+
+def strip_png_text(png: bytes) -> bytes:
+    """
+    Copy of a PNG without its text chunks, filtered chunk by chunk so the
+    image data is copied as is, not decoded.
+    """
+    kept = [PNG_SIGNATURE]
+    offset = len(PNG_SIGNATURE)
+    while offset < len(png):
+        length = int.from_bytes(png[offset : offset + 4], "big")
+        end = offset + 12 + length  # length, type, data, CRC
+        if png[offset + 4 : offset + 8] not in PNG_TEXT_CHUNKS:
+            kept.append(png[offset:end])
+        offset = end
+    return b"".join(kept)
 
-    if first_image_bytes is None:
-        raise Exception("No image was generated by ComfyUI")
 
-    # Convert to PNG in memory
-    img = Image.open(io.BytesIO(first_image_bytes))
+def encode_image(img: Image.Image, image_format: str) -> bytes:
     img_buffer = io.BytesIO()
-    img.save(img_buffer, format="PNG")
-    img_buffer.seek(0)
+    img.save(img_buffer, format=image_format)
+    return img_buffer.getvalue()
+
+
+def variant_format() -> str:
+    """COVER_VARIANT_FORMAT, or WEBP if this Pillow cannot write AVIF."""
+    image_format = settings.COVER_VARIANT_FORMAT.upper()
+    Image.init()
+    if image_format not in Image.SAVE:
+        print(f"Pillow cannot write {image_format} images, using WEBP")
+        return "WEBP"
+    return image_format
+
+
+def encode_cover_variants(img: Image.Image) -> Dict[str, Tuple[bytes, str]]:
+    """
+    Downscaled copies of a decoded cover: one per COVER_VARIANT_WIDTHS
+    narrower than the original, plus a thumbnail. Returns
+    {name: (encoded bytes, format)}.
+    """
+    image_format = variant_format()
+    widths = {
+        f"w{w}": int(w) for w in settings.COVER_VARIANT_WIDTHS.split(",") if w.strip()
+    }
+    widths["thumb"] = settings.COVER_THUMBNAIL_WIDTH
+
+    variants = {}
+    for name, width in widths.items():
+        if width >= img.width:
+            continue
+        height = round(img.height * width / img.width)
+        resized = img.resize((width, height), Image.LANCZOS)
+        variants[name] = (encode_image(resized, image_format), image_format)
+    return variants
 
-    # Define path in Supabase bucket
-    storage_path = f"{story_id}/cover-{seed}.png"
 
-    # Upload to Supabase Storage
+def _upload(
+    supabase_client, bucket_name: str, storage_path: str, data: bytes, content_type: str
+) -> str:
     supabase_client.storage.from_(bucket_name).upload(
         path=storage_path,
-        file=img_buffer.getvalue(),
-        file_options={"content-type": "image/png"},
+        file=data,
+        file_options={"content-type": content_type},
     )
+    return supabase_client.storage.from_(bucket_name).get_public_url(storage_path)
+
+
+def upload_cover_image(
+    image_bytes: bytes, supabase_client, bucket_name: str, story_id: str, seed: int
+) -> Dict[str, Any]:
+    """
+    Upload a rendered cover to Supabase Storage and return the story columns
+    to set: cover_image_url, plus cover_image_variants ({name: URL}) when
+    COVER_VARIANTS is on. ComfyUI already returns PNG, which is uploaded
+    without re-encoding, only with its text chunks (the prompt and workflow)
+    dropped; the image is decoded at most once, and all files upload
+    concurrently.
+    """
+    is_png = image_bytes.startswith(PNG_SIGNATURE)
+    img = None
+    if not is_png or settings.COVER_VARIANTS:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+
+    files = {
+        "full": (
+            f"{story_id}/cover-{seed}.png",
+            strip_png_text(image_bytes) if is_png else encode_image(img, "PNG"),
+            "image/png",
+        )
+    }
+    if settings.COVER_VARIANTS:
+        for name, (data, image_format) in encode_cover_variants(img).items():
+            extension = image_format.lower()
+            files[name] = (
+                f"{story_id}/cover-{seed}-{name}.{extension}",
+                data,
+                f"image/{extension}",
+            )
+
+    with ThreadPoolExecutor(max_workers=len(files)) as pool:
+        futures = {
+            name: pool.submit(_upload, supabase_client, bucket_name, *file)
+            for name, file in files.items()
+        }
+
+    columns: Dict[str, Any] = {"cover_image_url": futures.pop("full").result()}
+    if settings.COVER_VARIANTS:
+        columns["cover_image_variants"] = {
+            name: future.result() for name, future in futures.items()
+        }
+    return columns
+
+
+def generate_and_upload_cover_images_batch(
+    prompts: Dict[str, str],
+    supabase_client,
+    bucket_name: str,
+    workflow_file: str = "workflow.json",
+    on_progress: Optional[Callable[[str, dict], None]] = None,
+) -> Dict[str, Union[Dict[str, Any], Exception]]:
+    """
+    Render covers for several stories ({story_id: prompt}) as one pipelined
+    batch of queued ComfyUI prompts on one server, then upload them
+    concurrently. Returns {story_id: story columns from upload_cover_image,
+    or the exception for that story}. `on_progress(story_id, progress)`
+    receives sampler step updates.
+    """
+    story_ids = list(prompts)
+    built = [build_cover_workflow(prompts[s], workflow_file) for s in story_ids]
+
+    def report(progress: dict):
+        on_progress(story_ids[progress["index"]], progress)
+
+    outputs = get_comfy_pool().generate_images_many(
+        [workflow for workflow, _ in built],
+        on_progress=report if on_progress else None,
+        websocket_images=settings.COMFY_WEBSOCKET_IMAGES,
+    )
+
+    def upload(story_id: str, images_by_node: dict, seed: int) -> Dict[str, Any]:
+        return upload_cover_image(
+            first_image(images_by_node), supabase_client, bucket_name, story_id, seed
+        )
 
-    # Get the public URL
-    public_url = supabase_client.storage.from_(bucket_name).get_public_url(storage_path)
+    with ThreadPoolExecutor(max_workers=len(story_ids)) as pool:
+        futures = {
+            story_id: pool.submit(upload, story_id, images_by_node, seed)
+            for story_id, images_by_node, (_, seed) in zip(story_ids, outputs, built)
+        }
 
-    return public_url
+    results: Dict[str, Union[Dict[str, Any], Exception]] = {}
+    for story_id, future in futures.items():
+        try:
+            results[story_id] = future.result()
+        except Exception as e:
+            results[story_id] = e
+    return results
@@ -0,0 +1,369 @@
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+import httpx
+from ollama import ResponseError
+
+from config.config import settings
+
+DEFAULT_OLLAMA_URL = "http://127.0.0.1:11434"
+
+
+def parse_backends(spec: str) -> Dict[str, Optional[Set[str]]]:
+    """
+    Parse "http://gpu1:11434=gemma3:12b;http://gpu2:11434=mistral,llama3"
+    into {url: models}. A host listed without models serves every model.
+    """
+    backends: Dict[str, Optional[Set[str]]] = {}
+    for item in spec.split(";"):
+        item = item.strip()
+        if not item:
+            continue
+        # Split on the "=" after the URL; model names may contain ":"
+        url, sep, models = item.partition("=")
+        backends[url.rstrip("/")] = (
+            {m.strip() for m in models.split(",") if m.strip()} if sep else None
+        )
+    return backends
+
+
+def is_backend_failure(e: Exception) -> bool:
+    """True for errors that say the host is unwell rather than the request bad."""
+    if isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    return isinstance(e, ResponseError) and e.status_code >= 500
+
+
+class OllamaBackend:
+    def __init__(self, url: str, models: Optional[Set[str]] = None):
+        self.url = url
+        self.models = models
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+
+class OllamaBackendPool:
+    """
+    Routes Ollama calls across several hosts.
+
+    Each model is placed on the hosts configured for it, and a call goes to
+    the placed host with the fewest requests in flight. A host is skipped
+    while its last health check failed, or while its circuit is open: after
+    `failure_threshold` consecutive failed calls it gets no traffic for
+    `reset_seconds`, then one trial call decides whether it closes again.
+    Calls that fail on a host before producing any output fail over to the
+    next best host.
+
+    Short calls can also be hedged (see `hedged`): if a call runs past the
+    `hedge_percentile` of its recent latencies, the same call is sent to a
+    second host and the first answer wins. Hedges are capped at
+    `hedge_budget` times the number of hedgeable calls.
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, Optional[Set[str]]],
+        failure_threshold: int,
+        reset_seconds: float,
+        health_check_seconds: float,
+        hedge_percentile: float = 95,
+        hedge_budget: float = 0.05,
+        hedge_min_samples: int = 20,
+    ):
+        self.backends = [OllamaBackend(url, models) for url, models in backends.items()]
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.health_check_seconds = health_check_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self._lock = threading.Lock()
+        self._health_checker: Optional[threading.Thread] = None
+
+        # Per hedged call name: recent latencies and counters
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedge_counts: Dict[str, Dict[str, int]] = {}
+
+    def _available(self, backend: OllamaBackend, now: float) -> bool:
+        return backend.healthy and backend.circuit_open_until <= now
+
+    def _acquire(self, model: str, exclude: Set[str]) -> OllamaBackend:
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                b
+                for b in self.backends
+                if b.serves(model) and b.url not in exclude and self._available(b, now)
+            ]
+            if not candidates:
+                raise RuntimeError(f"No available Ollama backend for model '{model}'")
+
+            backend = min(candidates, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            backend.requests += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                # Half-open: hold the circuit shut for others until this trial ends
+                backend.circuit_open_until = now + self.reset_seconds
+            return backend
+
+    def _release(self, backend: OllamaBackend, error: Optional[Exception] = None):
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.consecutive_failures = 0
+                backend.circuit_open_until = 0.0
+                return
+
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.circuit_open_until = time.monotonic() + self.reset_seconds
+                print(f"[ollama] Circuit open for {backend.url}: {error}")
+
+    def stream(
+        self, model: str, call: Callable[[str], Iterator[Any]]
+    ) -> Iterator[Any]:
+        """
+        Yield from `call(host_url)` on the best host for `model`, failing over
+        to other hosts if it fails before the first item.
+        """
+        self.start_health_checks()
+        tried: Set[str] = set()
+
+        while True:
+            backend = self._acquire(model, exclude=tried)
+            tried.add(backend.url)
+            started = False
+            try:
+                for item in call(backend.url):
+                    started = True
+                    yield item
+            except Exception as e:
+                failed = is_backend_failure(e)
+                self._release(backend, e if failed else None)
+                if not failed or started:
+                    raise
+                print(f"[ollama] {backend.url} failed for {model}, failing over: {e}")
+                continue
+            except BaseException:
+                # Consumer stopped early (e.g. generator closed)
+                self._release(backend)
+                raise
+            self._release(backend)
+            return
+
+    def hedge_delay(self, name: str) -> Optional[float]:
+        """Seconds to wait before hedging call `name`; None until enough samples."""
+        with self._lock:
+            samples = sorted(self._latencies.get(name, ()))
+        if len(samples) < self.hedge_min_samples:
+            return None
+        index = min(int(len(samples) * self.hedge_percentile / 100), len(samples) - 1)
+        return samples[index]
+
+    def _take_hedge(self, name: str) -> bool:
+        """Spend budget on one hedge if the budget allows it."""
+        with self._lock:
+            counts = self._hedge_counts[name]
+            total_calls = sum(c["calls"] for c in self._hedge_counts.values())
+            total_hedges = sum(c["hedges"] for c in self._hedge_counts.values())
+            if total_hedges + 1 > self.hedge_budget * total_calls:
+                counts["over_budget"] += 1
+                return False
+            counts["hedges"] += 1
+            return True
+
+    def _run_attempt(
+        self,
+        backend: OllamaBackend,
+        call: Callable[[str], Iterator[Any]],
+        cancel: threading.Event,
+        finished: "queue.Queue[Tuple[OllamaBackend, Optional[Exception], List[Any]]]",
+    ):
+        items: List[Any] = []
+        error: Optional[Exception] = None
+        try:
+            stream = call(backend.url)
+            try:
+                for item in stream:
+                    if cancel.is_set():
+                        break
+                    items.append(item)
+            finally:
+                # Closing the stream drops the connection, so Ollama stops generating
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+        except Exception as e:
+            error = e
+        self._release(backend, error if error and is_backend_failure(error) else None)
+        finished.put((backend, error, items))
+
+    def hedged(
+        self, name: str, model: str, call: Callable[[str], Iterator[Any]]
+    ) -> List[Any]:
+        """
+        Run `call(host_url)` to completion and return everything it yielded,
+        sending a hedge to another host if it is slower than usual for call
+        `name`. The losing request is cancelled at its next streamed chunk.
+        A hedge holds no scheduler slot of its own; the budget bounds it.
+        """
+        self.start_health_checks()
+        with self._lock:
+            self._latencies.setdefault(name, deque(maxlen=200))
+            counts = self._hedge_counts.setdefault(
+                name, {"calls": 0, "hedges": 0, "hedge_wins": 0, "over_budget": 0}
+            )
+            counts["calls"] += 1
+
+        finished: "queue.Queue" = queue.Queue()
+        cancels: List[threading.Event] = []
+        tried: Set[str] = set()
+
+        def launch():
+            backend = self._acquire(model, exclude=tried)
+            tried.add(backend.url)
+            cancel = threading.Event()
+            cancels.append(cancel)
+            threading.Thread(
+                target=self._run_attempt,
+                args=(backend, call, cancel, finished),
+                name="ollama-hedge",
+                daemon=True,
+            ).start()
+
+        start = time.monotonic()
+        delay = self.hedge_delay(name)
+        launch()
+        first_url = next(iter(tried))
+        running = 1
+        can_hedge = delay is not None
+
+        while True:
+            timeout = max(delay - (time.monotonic() - start), 0) if can_hedge else None
+            try:
+                backend, error, items = finished.get(timeout=timeout)
+            except queue.Empty:
+                can_hedge = False
+                if self._take_hedge(name):
+                    try:
+                        launch()
+                        running += 1
+                    except RuntimeError:
+                        # No second host for this model: refund the budget
+                        with self._lock:
+                            counts["hedges"] -= 1
+                continue
+
+            running -= 1
+            if error is None:
+                for cancel in cancels:
+                    cancel.set()
+                with self._lock:
+                    self._latencies[name].append(time.monotonic() - start)
+                    if backend.url != first_url:
+                        counts["hedge_wins"] += 1
+                return items
+
+            if running:
+                continue
+            if not is_backend_failure(error):
+                raise error
+            print(f"[ollama] {backend.url} failed for {model}, failing over: {error}")
+            try:
+                launch()
+            except RuntimeError:
+                raise error
+            running += 1
+            can_hedge = False
+
+    def hedge_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for name in list(self._hedge_counts):
+            delay = self.hedge_delay(name)
+            with self._lock:
+                stats[name] = {
+                    **self._hedge_counts[name],
+                    "samples": len(self._latencies[name]),
+                    "hedge_delay_seconds": delay,
+                }
+        return stats
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                httpx.get(f"{backend.url}/api/tags", timeout=5).raise_for_status()
+                healthy = True
+            except Exception as e:
+                healthy = False
+                if backend.healthy:
+                    print(f"[ollama] Health check failed for {backend.url}: {e}")
+            with self._lock:
+                backend.healthy = healthy
+
+    def _run_health_checks(self):
+        while True:
+            time.sleep(self.health_check_seconds)
+            self.check_health()
+
+    def start_health_checks(self):
+        if self.health_check_seconds <= 0:
+            return
+        with self._lock:
+            if self._health_checker is None:
+                self._health_checker = threading.Thread(
+                    target=self._run_health_checks, name="ollama-health", daemon=True
+                )
+                self._health_checker.start()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "url": b.url,
+                    "models": sorted(b.models) if b.models is not None else "*",
+                    "outstanding": b.outstanding,
+                    "healthy": b.healthy,
+                    "circuit_open": b.circuit_open_until > now,
+                    "consecutive_failures": b.consecutive_failures,
+                    "requests": b.requests,
+                    "failures": b.failures,
+                }
+                for b in self.backends
+            ]
+
+
+_pool: Optional[OllamaBackendPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool() -> OllamaBackendPool:
+    """The pool from OLLAMA_BACKENDS, or just OLLAMA_BASE_URL if unset."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            backends = parse_backends(settings.OLLAMA_BACKENDS) or {
+                (settings.OLLAMA_BASE_URL or DEFAULT_OLLAMA_URL).rstrip("/"): None
+            }
+            _pool = OllamaBackendPool(
+                backends,
+                failure_threshold=settings.OLLAMA_CIRCUIT_FAILURES,
+                reset_seconds=settings.OLLAMA_CIRCUIT_RESET_SECONDS,
+                health_check_seconds=settings.OLLAMA_HEALTH_CHECK_SECONDS,
+                hedge_percentile=settings.OLLAMA_HEDGE_PERCENTILE,
+                hedge_budget=settings.OLLAMA_HEDGE_BUDGET,
+                hedge_min_samples=settings.OLLAMA_HEDGE_MIN_SAMPLES,
+            )
+        return _pool
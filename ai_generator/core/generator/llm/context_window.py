@@ -0,0 +1,161 @@
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.config import settings
+
+
+def parse_buckets(spec: str) -> List[int]:
+    return sorted(int(b) for b in spec.split(",") if b.strip())
+
+
+def parse_model_buckets(spec: str) -> Dict[str, List[int]]:
+    """Parse "gemma3:12b=8192,16384;llama3=4096" into {model: buckets}."""
+    buckets = {}
+    for item in spec.split(";"):
+        if not item.strip():
+            continue
+        model, _, sizes = item.strip().rpartition("=")
+        buckets[model] = parse_buckets(sizes)
+    return buckets
+
+
+class ContextSizer:
+    """
+    Picks num_ctx per call from the estimated prompt tokens plus the
+    expected output. Ollama reloads a model whenever its num_ctx changes, so
+    buckets are few and coarse (configurable per model), and the choice is
+    sticky: a model stays on its current bucket while calls fit in it, moves
+    up as soon as one does not, and only moves down after `shrink_after`
+    calls in a row would have fit a smaller one.
+
+    Prompt tokens are estimated from UTF-8 bytes with a per-model
+    bytes-per-token ratio, which starts at `bytes_per_token` and is then
+    calibrated from the prompt_eval_count Ollama reports for each call.
+    Calls whose estimate does not fit the largest bucket, or that filled
+    the context they ran with, are counted and logged as truncated.
+    """
+
+    def __init__(
+        self,
+        buckets: List[int],
+        bytes_per_token: float,
+        smoothing: float = 0.2,
+        model_buckets: Optional[Dict[str, List[int]]] = None,
+        shrink_after: int = 20,
+    ):
+        self.buckets = buckets
+        self.model_buckets = model_buckets or {}
+        self.default_bytes_per_token = bytes_per_token
+        self.smoothing = smoothing
+        self.shrink_after = shrink_after
+
+        self._bytes_per_token: Dict[str, float] = {}
+        self._bucket_counts: Dict[int, int] = {}
+        # Per model: bucket in use, and the largest bucket needed by the
+        # current run of calls that would have fit a smaller one
+        self._current: Dict[str, int] = {}
+        self._smaller: Dict[str, Tuple[int, int]] = {}
+        self.switches = 0
+        self.predicted_truncations = 0
+        self.observed_truncations = 0
+        self._lock = threading.Lock()
+
+    def estimate_tokens(self, model: str, text: str) -> int:
+        with self._lock:
+            ratio = self._bytes_per_token.get(model, self.default_bytes_per_token)
+        return math.ceil(len(text.encode("utf-8")) / ratio)
+
+    def buckets_for(self, model: str) -> List[int]:
+        return self.model_buckets.get(model, self.buckets)
+
+    def choose(self, model: str, prompt: str, output_tokens: int) -> int:
+        needed = self.estimate_tokens(model, prompt) + output_tokens
+        for bucket in self.buckets_for(model):
+            if bucket >= needed:
+                break
+        else:
+            with self._lock:
+                self.predicted_truncations += 1
+            print(
+                f"[num_ctx] {model} prompt needs ~{needed} tokens, more than the "
+                f"largest context ({bucket}); Ollama will truncate it"
+            )
+
+        with self._lock:
+            bucket = self._stick(model, bucket)
+            self._bucket_counts[bucket] = self._bucket_counts.get(bucket, 0) + 1
+        return bucket
+
+    def _stick(self, model: str, bucket: int) -> int:
+        """The bucket to use when `bucket` is the best fit; caller holds _lock."""
+        current = self._current.get(model)
+        if current is not None and bucket <= current:
+            if bucket == current:
+                self._smaller.pop(model, None)
+                return current
+            streak, largest = self._smaller.get(model, (0, 0))
+            streak, largest = streak + 1, max(largest, bucket)
+            if streak < self.shrink_after:
+                self._smaller[model] = (streak, largest)
+                return current
+            bucket = largest
+
+        if current is not None:
+            self.switches += 1
+        self._current[model] = bucket
+        self._smaller.pop(model, None)
+        return bucket
+
+    def observe(self, model: str, prompt: str, num_ctx: int, response: Any):
+        """Calibrate from a final ("done") Ollama response."""
+        prompt_tokens = response.get("prompt_eval_count") or 0
+        output_tokens = response.get("eval_count") or 0
+
+        if prompt_tokens + output_tokens >= num_ctx:
+            with self._lock:
+                self.observed_truncations += 1
+            print(
+                f"[num_ctx] {model} filled its {num_ctx}-token context "
+                f"({prompt_tokens} prompt + {output_tokens} output tokens)"
+            )
+
+        # Small or truncated prompts say little about the ratio
+        if prompt_tokens < 64 or prompt_tokens >= num_ctx:
+            return
+        with self._lock:
+            ratio = self._bytes_per_token.get(model, self.default_bytes_per_token)
+            measured = len(prompt.encode("utf-8")) / prompt_tokens
+            # Ollama counts only uncached prompt tokens, which inflates the ratio
+            if measured > ratio * 1.5:
+                return
+            self._bytes_per_token[model] = ratio + self.smoothing * (measured - ratio)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "buckets": dict(self._bucket_counts),
+                "current": dict(self._current),
+                "switches": self.switches,
+                "bytes_per_token": dict(self._bytes_per_token),
+                "predicted_truncations": self.predicted_truncations,
+                "observed_truncations": self.observed_truncations,
+            }
+
+
+_sizer: Optional[ContextSizer] = None
+_sizer_lock = threading.Lock()
+
+
+def get_context_sizer() -> ContextSizer:
+    global _sizer
+
+    with _sizer_lock:
+        if _sizer is None:
+            _sizer = ContextSizer(
+                parse_buckets(settings.LLM_CTX_BUCKETS),
+                bytes_per_token=settings.LLM_BYTES_PER_TOKEN,
+                model_buckets=parse_model_buckets(settings.LLM_MODEL_CTX_BUCKETS),
+                shrink_after=settings.LLM_CTX_SHRINK_AFTER,
+            )
+        return _sizer
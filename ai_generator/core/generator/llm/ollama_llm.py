@@ -1,8 +1,217 @@
-from typing import Literal, Optional, Union
+import contextvars
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple, Union
+
+import httpx
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.outputs import GenerationChunk, LLMResult
 from langchain_ollama import OllamaLLM
+from pydantic import PrivateAttr
+
+from config.config import settings
+from core.generator.llm.backend_pool import get_backend_pool
+from core.generator.llm.context_window import get_context_sizer
+from core.generator.llm.response_cache import get_response_cache
+from core.generator.llm.scheduler import get_llm_scheduler
+
+# One HTTP transport pair per Ollama host. Every client for that host is built
+# on it through OllamaLLM's client kwargs, so keep-alive connections are
+# reused across agents and calls.
+_transports: Dict[
+    Optional[str], Tuple[httpx.HTTPTransport, httpx.AsyncHTTPTransport]
+] = {}
+_transports_lock = threading.Lock()
+
+# One OllamaLLM per (model, sampling parameters, host).
+_llm_registry: Dict[tuple, OllamaLLM] = {}
+
+_registry_lock = threading.Lock()
+
+# Events of every enclosing llm_cancel_event block; any one cancels the call
+_cancel_events: contextvars.ContextVar[Tuple[threading.Event, ...]] = (
+    contextvars.ContextVar("llm_cancel_events", default=())
+)
+
+
+class LLMCallCancelled(Exception):
+    pass
+
+
+@contextmanager
+def llm_cancel_event(event: threading.Event) -> Iterator[None]:
+    """Abort the LLM calls made inside this block (and in threads started
+    with a copy of this context) once `event` is set. A running call stops at
+    its next streamed chunk and closes its connection, so Ollama stops
+    generating too. Blocks nest: an outer event still cancels the calls of an
+    inner block."""
+    token = _cancel_events.set(_cancel_events.get() + (event,))
+    try:
+        yield
+    finally:
+        _cancel_events.reset(token)
+
+
+def _cancelled(events: Tuple[threading.Event, ...]) -> bool:
+    return any(event.is_set() for event in events)
+
+
+def _until_cancelled(
+    chunks: Iterator[GenerationChunk], cancel: Tuple[threading.Event, ...]
+) -> Iterator[GenerationChunk]:
+    try:
+        for chunk in chunks:
+            if _cancelled(cancel):
+                raise LLMCallCancelled("LLM call cancelled")
+            yield chunk
+    finally:
+        chunks.close()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.OLLAMA_POOL_SIZE,
+        max_keepalive_connections=settings.OLLAMA_POOL_SIZE,
+        keepalive_expiry=settings.OLLAMA_HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+def client_kwargs(base_url: Optional[str]) -> Dict[str, Any]:
+    """OllamaLLM client kwargs that share the pooled transports of `base_url`."""
+    with _transports_lock:
+        transports = _transports.get(base_url)
+        if transports is None:
+            transports = (
+                httpx.HTTPTransport(limits=_pool_limits()),
+                httpx.AsyncHTTPTransport(limits=_pool_limits()),
+            )
+            _transports[base_url] = transports
+    return {
+        "sync_client_kwargs": {"transport": transports[0]},
+        "async_client_kwargs": {"transport": transports[1]},
+    }
+
+
+class ScheduledOllamaLLM(OllamaLLM):
+    """OllamaLLM whose calls wait for a slot from the LLM scheduler, at the
+    priority class of the calling context, and are routed through the Ollama
+    backend pool unless the instance is pinned to one host. Cache hits never
+    reach Ollama and so skip both.
+
+    Each call runs on a plain OllamaLLM with the same parameters, created per
+    (host, num_ctx) and kept for reuse."""
+
+    _routed: bool = PrivateAttr(default=True)
+    _hedge: Optional[str] = PrivateAttr(default=None)
+    _output_tokens: int = PrivateAttr(default=1024)
+    _host_llms: Dict[tuple, OllamaLLM] = PrivateAttr(default_factory=dict)
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        # LangChain builds the response cache key from these, so every
+        # parameter that changes the output has to be here
+        return {
+            "model": self.model,
+            "temperature": self.temperature,
+            "top_k": self.top_k,
+            "top_p": self.top_p,
+            "format": self.format,
+            "num_ctx": self.num_ctx,
+            "num_predict": self.num_predict,
+            "backend": "pool" if self._routed else self.base_url,
+        }
+
+    def _host_llm(self, base_url: Optional[str], num_ctx: Optional[int]) -> OllamaLLM:
+        key = (base_url, num_ctx)
+        with _registry_lock:
+            llm = self._host_llms.get(key)
+            if llm is None:
+                llm = OllamaLLM(
+                    model=self.model,
+                    temperature=self.temperature,
+                    top_k=self.top_k,
+                    top_p=self.top_p,
+                    format=self.format,
+                    num_ctx=num_ctx,
+                    num_predict=self.num_predict,
+                    keep_alive=self.keep_alive,
+                    base_url=base_url,
+                    **client_kwargs(base_url),
+                )
+                self._host_llms[key] = llm
+            return llm
+
+    def _chunks(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        cancel = _cancel_events.get()
+        if _cancelled(cancel):
+            raise LLMCallCancelled("LLM call cancelled")
+
+        sizer = get_context_sizer() if self.num_ctx is None else None
+        if sizer:
+            num_ctx = sizer.choose(self.model, prompt, self._output_tokens)
+        else:
+            num_ctx = self.num_ctx
+
+        def call(url: str, manager=run_manager) -> Iterator[GenerationChunk]:
+            chunks = self._host_llm(url, num_ctx)._stream(
+                prompt, stop=stop, run_manager=manager, **kwargs
+            )
+            return _until_cancelled(chunks, cancel) if cancel else chunks
+
+        if not self._routed:
+            chunks = call(self.base_url)
+        elif self._hedge and settings.OLLAMA_HEDGING:
+            # Hedged calls only return once the winning response is complete
+            chunks = get_backend_pool().hedged(
+                self._hedge, self.model, lambda url: call(url, None)
+            )
+            if run_manager:
+                for chunk in chunks:
+                    run_manager.on_llm_new_token(chunk.text, verbose=self.verbose)
+        else:
+            chunks = get_backend_pool().stream(self.model, call)
+
+        for chunk in chunks:
+            info = chunk.generation_info or {}
+            if sizer and info.get("done"):
+                sizer.observe(self.model, prompt, num_ctx, info)
+            yield chunk
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        generations = []
+        with get_llm_scheduler().slot(self.model):
+            for prompt in prompts:
+                final_chunk = None
+                for chunk in self._chunks(prompt, stop, run_manager, **kwargs):
+                    final_chunk = chunk if final_chunk is None else final_chunk + chunk
+                if final_chunk is None:
+                    raise ValueError("No data received from Ollama stream.")
+                generations.append([final_chunk])
+        return LLMResult(generations=generations)
+
+    def _stream(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[GenerationChunk]:
+        with get_llm_scheduler().slot(self.model):
+            yield from self._chunks(prompt, stop, run_manager, **kwargs)
 
 
-# 💡 This can be extended later with model registry, streaming, etc.
 def get_ollama(
     temperature: float = 0.8,
     top_k: int = 40,
@@ -12,8 +221,50 @@ def get_ollama(
     num_ctx: Optional[int] = None,
     keep_alive: Optional[Union[int, str]] = None,
     model: str = "llama3",
+    base_url: Optional[str] = None,
+    cache: bool = False,
+    hedge: Optional[str] = None,
+    output_tokens: Optional[int] = None,
 ) -> OllamaLLM:
-    return OllamaLLM(
+    """
+    Return a process-wide OllamaLLM for these parameters. Instances are
+    created once and reused, and all clients for a host share one pooled
+    HTTP transport, so calls from any thread skip connection setup.
+    Without an explicit `base_url`, each call goes to a host picked by the
+    backend pool (see OLLAMA_BACKENDS). Naming a `hedge` makes short calls
+    eligible for hedging across hosts when OLLAMA_HEDGING is on; latency
+    percentiles are tracked per hedge name. `output_tokens` caps the output
+    (num_predict). Unless `num_ctx` is given, each call gets a context bucket
+    that fits its prompt plus `output_tokens`, or LLM_DEFAULT_OUTPUT_TOKENS
+    when uncapped (see ContextSizer).
+    With `cache=True` responses go through the on-disk response cache; only
+    use it for low-temperature calls whose output is worth reusing.
+    """
+    routed = base_url is None
+    base_url = base_url or settings.OLLAMA_BASE_URL
+    keep_alive = keep_alive if keep_alive is not None else settings.OLLAMA_KEEP_ALIVE
+    key = (
+        model,
+        temperature,
+        top_k,
+        top_p,
+        verbose,
+        format,
+        num_ctx,
+        keep_alive,
+        base_url,
+        routed,
+        cache,
+        hedge,
+        output_tokens,
+    )
+
+    with _registry_lock:
+        llm = _llm_registry.get(key)
+    if llm is not None:
+        return llm
+
+    llm = ScheduledOllamaLLM(
         model=model,
         temperature=temperature,
         top_k=top_k,
@@ -21,5 +272,15 @@ def get_ollama(
         verbose=verbose,
         format=format,
         num_ctx=num_ctx,
+        num_predict=output_tokens,
         keep_alive=keep_alive,
+        base_url=base_url,
+        cache=get_response_cache() if cache else None,
+        **client_kwargs(base_url),
     )
+    llm._routed = routed
+    llm._hedge = hedge
+    llm._output_tokens = output_tokens or settings.LLM_DEFAULT_OUTPUT_TOKENS
+
+    with _registry_lock:
+        return _llm_registry.setdefault(key, llm)
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+from langchain_core.caches import BaseCache
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.outputs import Generation
+
+from config.config import settings
+
+
+class SQLiteLLMCache(BaseCache):
+    """
+    Content-addressed LLM response cache in a local SQLite file.
+
+    Entries are keyed by a hash of the LLM parameter string (model, sampling
+    options, format, ...) and the rendered prompt. Entries older than
+    `ttl_seconds` are treated as misses, and the least recently used entries
+    are evicted once the stored responses exceed `max_bytes`.
+
+    The cached agents all parse their output with JsonOutputParser, so only
+    responses it can parse are stored; a malformed answer is retried on the
+    next call rather than replayed.
+    """
+
+    def __init__(self, path: str, max_bytes: int, ttl_seconds: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._parser = JsonOutputParser()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, timeout=30, check_same_thread=False, isolation_level=None
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+            )
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[Sequence[Generation]]:
+        key = self._key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self.hits += 1
+
+        return [Generation(**gen) for gen in json.loads(row[0])]
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: Sequence[Generation]
+    ) -> None:
+        if not return_val:
+            return
+        try:
+            for gen in return_val:
+                self._parser.parse(gen.text)
+        except OutputParserException:
+            return
+
+        value = json.dumps(
+            [
+                {"text": gen.text, "generation_info": gen.generation_info}
+                for gen in return_val
+            ]
+        )
+        now = time.time()
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, len(value), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until under max_bytes; hold _lock."""
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM llm_cache"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT key, size FROM llm_cache ORDER BY accessed_at"
+        ).fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_response_cache: Optional[SQLiteLLMCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> SQLiteLLMCache:
+    global _response_cache
+
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SQLiteLLMCache(
+                settings.LLM_CACHE_PATH,
+                max_bytes=settings.LLM_CACHE_MAX_BYTES,
+                ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+            )
+        return _response_cache
@@ -0,0 +1,199 @@
+import contextvars
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+from config.config import settings
+
+# Lower rank runs first
+PRIORITY_CLASSES = {"interactive": 0, "prefetch": 1, "batch": 2}
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "llm_priority", default="interactive"
+)
+_boost: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "llm_priority_boost", default=None
+)
+
+
+@contextmanager
+def llm_priority(
+    priority_class: str, boost: Optional[threading.Event] = None
+) -> Iterator[None]:
+    """Run the LLM calls made inside this block (and in threads started with
+    a copy of this context) under `priority_class`. Once `boost` is set, they
+    run as interactive instead, including calls already queued; set it when
+    an interactive request ends up waiting on this work."""
+    if priority_class not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority_class}")
+    token = _priority.set(priority_class)
+    boost_token = _boost.set(boost)
+    try:
+        yield
+    finally:
+        _boost.reset(boost_token)
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    boost = _boost.get()
+    return "interactive" if boost is not None and boost.is_set() else _priority.get()
+
+
+def parse_model_limits(spec: str) -> Dict[str, int]:
+    """Parse "gemma3:12b=1,llama3=2" into {"gemma3:12b": 1, "llama3": 2}."""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        model, _, limit = item.strip().rpartition("=")
+        limits[model] = int(limit)
+    return limits
+
+
+class _Waiter:
+    __slots__ = ("base_class", "boost", "seq", "enqueued_at", "ready")
+
+    def __init__(
+        self, priority_class: str, seq: int, boost: Optional[threading.Event] = None
+    ):
+        self.base_class = priority_class
+        self.boost = boost
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.ready = threading.Event()
+
+    @property
+    def priority_class(self) -> str:
+        if self.boost is not None and self.boost.is_set():
+            return "interactive"
+        return self.base_class
+
+    @property
+    def rank(self) -> int:
+        return PRIORITY_CLASSES[self.priority_class]
+
+
+class LLMScheduler:
+    """
+    Admission control for LLM calls, per model.
+
+    Each model runs at most its concurrency limit of calls at once; further
+    calls queue. When a slot frees up the waiting call with the best priority
+    class goes next, ties going to the oldest. Waiting calls age: every
+    `aging_seconds` spent in the queue moves a call up one class, so batch
+    work still progresses under a steady stream of interactive calls.
+    """
+
+    def __init__(
+        self,
+        model_limits: Dict[str, int],
+        default_limit: int,
+        aging_seconds: float,
+        history: int = 1000,
+    ):
+        self.model_limits = model_limits
+        self.default_limit = default_limit
+        self.aging_seconds = aging_seconds
+
+        self._running: Dict[str, int] = {}
+        self._waiting: Dict[str, List[_Waiter]] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+        self._admitted = {c: 0 for c in PRIORITY_CLASSES}
+        self._wait_total = {c: 0.0 for c in PRIORITY_CLASSES}
+        self._recent_waits: Dict[str, Deque[float]] = {
+            c: deque(maxlen=history) for c in PRIORITY_CLASSES
+        }
+
+    def limit_for(self, model: str) -> int:
+        return self.model_limits.get(model, self.default_limit)
+
+    def _effective_rank(self, waiter: _Waiter, now: float) -> float:
+        if not self.aging_seconds:
+            return waiter.rank
+        return waiter.rank - (now - waiter.enqueued_at) / self.aging_seconds
+
+    def _dispatch(self, model: str):
+        """Admit waiters while the model has free slots. Caller holds _lock."""
+        waiting = self._waiting.get(model)
+        now = time.monotonic()
+        while waiting and self._running.get(model, 0) < self.limit_for(model):
+            waiter = min(waiting, key=lambda w: (self._effective_rank(w, now), w.seq))
+            waiting.remove(waiter)
+            self._running[model] = self._running.get(model, 0) + 1
+
+            waited = now - waiter.enqueued_at
+            priority_class = waiter.priority_class
+            self._admitted[priority_class] += 1
+            self._wait_total[priority_class] += waited
+            self._recent_waits[priority_class].append(waited)
+            waiter.ready.set()
+
+    @contextmanager
+    def slot(self, model: str, priority_class: Optional[str] = None) -> Iterator[None]:
+        """Hold one of `model`'s call slots for the duration of the block."""
+        if priority_class:
+            waiter = _Waiter(priority_class, next(self._seq))
+        else:
+            waiter = _Waiter(_priority.get(), next(self._seq), boost=_boost.get())
+        with self._lock:
+            self._waiting.setdefault(model, []).append(waiter)
+            self._dispatch(model)
+        waiter.ready.wait()
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[model] -= 1
+                self._dispatch(model)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            queued = {c: 0 for c in PRIORITY_CLASSES}
+            for waiting in self._waiting.values():
+                for waiter in waiting:
+                    queued[waiter.priority_class] += 1
+
+            classes = {}
+            for c in PRIORITY_CLASSES:
+                recent = sorted(self._recent_waits[c]) or [0.0]
+                admitted = self._admitted[c]
+                classes[c] = {
+                    "queued": queued[c],
+                    "admitted": admitted,
+                    "mean_wait_seconds": (
+                        self._wait_total[c] / admitted if admitted else 0.0
+                    ),
+                    "p50_wait_seconds": recent[len(recent) // 2],
+                    "p95_wait_seconds": recent[int(len(recent) * 0.95)],
+                    "max_wait_seconds": recent[-1],
+                }
+
+            return {
+                "running": {m: n for m, n in self._running.items() if n},
+                "limits": {**self.model_limits, "default": self.default_limit},
+                "classes": classes,
+            }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_llm_scheduler() -> LLMScheduler:
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                parse_model_limits(settings.LLM_MODEL_CONCURRENCY),
+                default_limit=settings.LLM_DEFAULT_CONCURRENCY,
+                aging_seconds=settings.LLM_PRIORITY_AGING_SECONDS,
+            )
+        return _scheduler
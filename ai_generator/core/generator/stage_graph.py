@@ -0,0 +1,60 @@
+import contextvars
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.config import settings
+from core.generator.stages import Stage
+
+
+def _run_timed(stage: Stage, state: Dict[str, Any]) -> Tuple[Any, float]:
+    start = time.perf_counter()
+    result = stage["run"](state)
+    return result, time.perf_counter() - start
+
+
+def run_stage_graph(
+    stages: List[Stage],
+    state: Dict[str, Any],
+    max_concurrency: Optional[int] = None,
+    on_stage: Optional[Callable[[str, float], None]] = None,
+) -> Dict[str, float]:
+    """
+    Run stages as a dependency graph: every stage whose `needs` are done is
+    started, at most `max_concurrency` at a time. Results are written into
+    `state` under the stage name. Returns seconds spent per stage plus "total".
+    `on_stage(name, seconds)` is called as each stage finishes.
+    """
+    max_concurrency = max_concurrency or settings.PIPELINE_MAX_CONCURRENCY
+    pending = list(stages)
+    done = set()
+    running = {}
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+        while pending or running:
+            ready = [s for s in pending if all(n in done for n in s["needs"])]
+            for stage in ready[: max_concurrency - len(running)]:
+                pending.remove(stage)
+                ctx = contextvars.copy_context()
+                running[pool.submit(ctx.run, _run_timed, stage, state)] = stage
+
+            if not running:
+                raise ValueError(
+                    f"Unresolvable stage dependencies: {[s['name'] for s in pending]}"
+                )
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                result, elapsed = future.result()
+                state[stage["name"]] = result
+                timings[stage["name"]] = elapsed
+                done.add(stage["name"])
+                print(f"Stage '{stage['name']}' finished in {elapsed:.2f}s")
+                if on_stage:
+                    on_stage(stage["name"], elapsed)
+
+    timings["total"] = time.perf_counter() - start
+    return timings
@@ -0,0 +1,132 @@
+from typing import Any, Dict, List
+
+from core.generator.agents.critique_agent import critique_draft_story
+from core.generator.agents.extract_characters_agent import extract_character_data
+from core.generator.agents.final_story_agent import (
+    build_story_metadata,
+    generate_final_story_text,
+)
+from core.generator.agents.image_generator_prompt_agent import generate_image_prompt
+from core.generator.agents.metadata_extraction_agent import extract_story_metadata
+from core.generator.agents.sketchboard_agent import generate_sketchboard
+from core.generator.agents.story_prompt_agent import generate_draft_story
+from core.generator.agents.title_agent import generate_title
+
+# A stage is a dict with:
+#   name  - key the stage result is stored under in the story state
+#   model - Ollama model the stage runs on
+#   needs - stage names that must have finished first
+#   run   - callable taking the story state and returning the stage result
+Stage = Dict[str, Any]
+
+EXTRACTION_MODEL = "mistral"
+TITLE_MODEL = "llama3"
+IMAGE_PROMPT_MODEL = "llama3"
+
+
+def safe_extract_character_data(sketch: str) -> Dict[str, Any]:
+    try:
+        character_data = extract_character_data(sketch, model_name=EXTRACTION_MODEL)
+        print(character_data)
+    except:
+        character_data = {}
+        print("Error in JSON Format")
+    return character_data
+
+
+def full_story_stages(model_used: str = "llama3") -> List[Stage]:
+    """
+    Stages of the first-page pipeline, listed in per-story sequential order;
+    batch mode uses this order as the baseline for counting model swaps.
+    """
+    return [
+        {
+            "name": "sketch",
+            "model": model_used,
+            "needs": [],
+            "run": lambda s: generate_sketchboard(
+                s["genre"], s["tone"], model_name=model_used
+            ),
+        },
+        {
+            "name": "character_data",
+            "model": EXTRACTION_MODEL,
+            "needs": ["sketch"],
+            "run": lambda s: safe_extract_character_data(s["sketch"]),
+        },
+        {
+            "name": "draft",
+            "model": model_used,
+            "needs": ["sketch"],
+            "run": lambda s: generate_draft_story(
+                sketch_text=s["sketch"], model_used=model_used
+            ),
+        },
+        {
+            "name": "critique",
+            "model": model_used,
+            "needs": ["sketch", "draft"],
+            "run": lambda s: critique_draft_story(
+                draft_text=s["draft"], sketch=s["sketch"], model_used=model_used
+            ),
+        },
+        {
+            "name": "final_text",
+            "model": model_used,
+            "needs": ["sketch", "draft", "critique"],
+            "run": lambda s: generate_final_story_text(
+                s["sketch"], s["draft"], s["critique"], model_used=model_used
+            ),
+        },
+        {
+            "name": "title",
+            "model": TITLE_MODEL,
+            "needs": ["final_text"],
+            "run": lambda s: generate_title(s["final_text"], model_name=TITLE_MODEL),
+        },
+        {
+            "name": "metadata",
+            "model": EXTRACTION_MODEL,
+            "needs": ["sketch", "final_text"],
+            "run": lambda s: extract_story_metadata(
+                s["sketch"], s["final_text"], model_name=EXTRACTION_MODEL
+            ),
+        },
+        {
+            "name": "image_prompt",
+            "model": IMAGE_PROMPT_MODEL,
+            "needs": ["sketch", "final_text"],
+            "run": lambda s: generate_image_prompt(
+                s["sketch"], s["final_text"], model_name=IMAGE_PROMPT_MODEL
+            ),
+        },
+    ]
+
+
+def assemble_full_story(state: Dict[str, Any], model_used: str = "llama3") -> tuple:
+    """
+    Build the (final, character_data, sketch, critique, image_prompt) tuple
+    returned by generate_full_story_pipeline from a finished story state.
+    """
+    final = {
+        "metadata": build_story_metadata(
+            genre=", ".join(state["genre"]),
+            tone=state["tone"],
+            title=state["title"],
+            final_story=state["final_text"],
+            sketch_text=state["sketch"],
+            draft_text=state["draft"],
+            critique_text=state["critique"],
+            model_used=model_used,
+        ),
+        "content": state["final_text"],
+    }
+    final["metadata"].update(state["metadata"])
+
+    return (
+        final,
+        state["character_data"],
+        state["sketch"],
+        state["critique"],
+        state["image_prompt"],
+    )
@@ -1,28 +1,27 @@
-from typing import Dict, Any, Union
-from core.generator.agents.extract_characters_agent import (
-    extract_character_data,
-    extract_new_character_data,
-)
+import time
+from typing import Callable, Dict, Any, Iterator, Optional, Union
+from core.generator.agents.extract_characters_agent import extract_new_character_data
 from core.generator.agents.metadata_extraction_agent import extract_story_metadata
 from core.generator.agents.sketchboard_agent import (
-    generate_sketchboard,
     generate_sketchboard_for_continuation,
 )
 from core.generator.agents.story_prompt_agent import (
-    generate_draft_story,
     generate_draft_story_for_continuation,
 )
-from core.generator.agents.critique_agent import (
-    critique_draft_for_continuation,
-    critique_draft_story,
-)
+from core.generator.agents.critique_agent import critique_draft_for_continuation
 from core.generator.agents.final_story_agent import (
-    generate_final_story,
     generate_final_story_for_continuation,
+    stream_final_story_for_continuation,
 )
+from core.generator.prompt.final_story import final_continuation_prompt
 
-from core.generator.agents.image_generator_prompt_agent import generate_image_prompt
 from core.constants.helper import random_genre, random_tone
+from core.generator.candidates import generate_best_candidate
+from core.generator.stage_graph import run_stage_graph
+from core.generator.stages import assemble_full_story, full_story_stages
+from schemas.context import StoryContext
+from utilities.character_roster import CharacterRoster
+from utilities.context_loader import load_next_page_context
 from utilities.supabase_helper import save_characters_to_db
 
 
@@ -32,10 +31,7 @@ from utilities.utils import (
     build_rich_context_string,
     extract_and_save_new_relationships,
     is_semantically_in_range,
-    load_comprehensive_context,
-    load_story_continuity_rules,
     save_story_critique,
-    update_character_emotional_progression,
     format_continuity_rules_for_prompt,
     update_story_state_after_page,
     get_context_changes,
@@ -44,59 +40,71 @@ from utilities.utils import (
 
 def generate_full_story_pipeline(
     model_used: str = "llama3",
+    max_concurrency: Optional[int] = None,
+    on_stage: Optional[Callable[[str, float], None]] = None,
 ) -> Tuple[Dict[str, Any], Any, str, str, str]:
-    genre = random_genre()
-    tone = random_tone()
-
-    # Step 1: Sketchboard
-    sketch = generate_sketchboard(genre, tone, model_name=model_used)
-    print(sketch)
-
-    try:
-        character_data = extract_character_data(sketch)
-        print(character_data)
-    except:
-        character_data = {}
-        print("Error in JSON Format")
-    # Step 2: First Draft
-    draft = generate_draft_story(sketch_text=sketch, model_used=model_used)
-    print(draft)
-    # Step 3: Critique
-    critique = critique_draft_story(
-        draft_text=draft, sketch=sketch, model_used=model_used
+    """
+    Run the first-page pipeline as a dependency graph. Character extraction
+    and the draft both only need the sketch; title, metadata and image prompt
+    only need the final text, so those run concurrently.
+    Per-stage timings are returned under final["timings"].
+    """
+    state = {"genre": random_genre(), "tone": random_tone()}
+
+    timings = run_stage_graph(
+        full_story_stages(model_used),
+        state,
+        max_concurrency=max_concurrency,
+        on_stage=on_stage,
     )
 
-    print(critique)
-
-    # Step 4: Final Story
-    final = generate_final_story(
-        genre=", ".join(genre),
-        tone=tone,
-        sketch_text=sketch,
-        draft_text=draft,
-        critique_text=critique,
-        model_used=model_used,
+    final, character_data, sketch, critique, image_prompt = assemble_full_story(
+        state, model_used=model_used
     )
-
-    extracted_metadata = extract_story_metadata(sketch, final["content"])
-    final["metadata"].update(extracted_metadata)
-
-    image_prompt = generate_image_prompt(sketch, final["content"])
+    final["timings"] = timings
     return final, character_data, sketch, critique, image_prompt
 
 
-def generate_next_page_pipeline(
-    story: dict, last_page: dict, character_context: str, model: str = "llama3"
-) -> dict:
-
-    context = load_comprehensive_context(story["story_id"], last_page["page_number"])
-    rich_context_str = build_rich_context_string(context)
+def iter_next_page_pipeline(
+    story: dict,
+    last_page: dict,
+    character_context: str,
+    model: str = "llama3",
+    stream: bool = False,
+    context: Optional[StoryContext] = None,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Run the next-page pipeline, yielding (event, data) pairs as it goes:
+    "stage" after each step, "token" for final-text chunks when `stream` is
+    set, "retry" when a streamed final attempt is discarded, and a last
+    "result" event carrying the same dict generate_next_page_pipeline returns.
+    Pass the already loaded `context` to skip reloading it.
+
+    The pipeline does not write story state; once the page is stored, the
+    caller persists it with persist_next_page_state.
+    """
+    timings: Dict[str, float] = {}
+    lap_start = time.perf_counter()
+
+    def lap(stage: str) -> Dict[str, Any]:
+        nonlocal lap_start
+        now = time.perf_counter()
+        timings[stage] = now - lap_start
+        lap_start = now
+        return {"stage": stage, "seconds": round(timings[stage], 3)}
+
+    if context is None:
+        context = load_next_page_context(story["story_id"])
+    timings.update(context.timings)
+    rich_context_str = build_rich_context_string(context.narrative_context())
+    yield "stage", lap("context")
 
     sketch = generate_sketchboard_for_continuation(
         story, last_page, rich_context_str, model=model
     )
 
     print(sketch)
+    yield "stage", lap("sketch")
 
     try:
         character_data = extract_new_character_data(sketch)
@@ -105,65 +113,132 @@ def generate_next_page_pipeline(
         character_data = []
         print("Error in JSON Format")
 
-    update_character_emotional_progression(story["story_id"], sketch)
-    for character in character_data:
-        extract_and_save_new_relationships(story["story_id"], character, sketch)
+    yield "stage", lap("characters")
 
-    rules = load_story_continuity_rules(story["story_id"])
-    rules_text = format_continuity_rules_for_prompt(rules)
+    rules_text = format_continuity_rules_for_prompt(context.continuity_rules)
 
-    draft = ""
-    attempt = 1
-    while True:
-        draft = generate_draft_story_for_continuation(
+    draft, _ = generate_best_candidate(
+        lambda: generate_draft_story_for_continuation(
             sketch, last_page["content"], rules_text, model=model
-        )
-        if is_semantically_in_range(last_page["content"], draft, lt=0.7, ut=0.89):
-            break
-        print(f"Attempt {attempt+1}: Similar to last page, retrying...")
-        attempt += 1
+        ),
+        reference=last_page["content"],
+        lt=0.7,
+        ut=0.89,
+    )
 
     print(draft)
+    yield "stage", lap("draft")
 
     critique = critique_draft_for_continuation(draft, last_page["content"], model=model)
     print(critique)
 
-    save_story_critique(
-        story["story_id"],
-        last_page["page_number"] + 1,
-        critique_type="continuity",
-        critique_content=critique,
-        suggested_improvements=[],
-        severity_level=2,
-    )
-
-    max_retries = 2
-    final = {"content": draft}
-    for attempt in range(max_retries + 1):
-        final = generate_final_story_for_continuation(
-            context=last_page["content"],
-            draft_text=draft,
-            critique_text=critique,
-            character_context=rich_context_str,
-            model=model,
+    yield "stage", lap("critique")
+
+    if stream:
+        # Streamed text cannot be chosen after the fact, so stream one attempt
+        # at a time and let the reader discard it on a "retry" event.
+        max_retries = 2
+        final = {"content": draft}
+        for attempt in range(max_retries + 1):
+            chunks = []
+            for chunk in stream_final_story_for_continuation(
+                context=last_page["content"],
+                draft_text=draft,
+                critique_text=critique,
+                character_context=rich_context_str,
+                model=model,
+            ):
+                chunks.append(chunk)
+                yield "token", {"text": chunk}
+            final = {
+                "content": "".join(chunks).strip(),
+                "generation_prompt": final_continuation_prompt().format(
+                    context=last_page["content"],
+                    draft=draft,
+                    critique=critique,
+                    character_context=rich_context_str,
+                ),
+            }
+            if is_semantically_in_range(draft, final["content"], lt=0.83, ut=0.92):
+                break
+            if attempt < max_retries:
+                print(f"Attempt {attempt+1}: Different from draft, retrying...")
+                yield "retry", {"attempt": attempt + 2}
+    else:
+        final, _ = generate_best_candidate(
+            lambda: generate_final_story_for_continuation(
+                context=last_page["content"],
+                draft_text=draft,
+                critique_text=critique,
+                character_context=rich_context_str,
+                model=model,
+            ),
+            reference=draft,
+            lt=0.83,
+            ut=0.92,
+            text_of=lambda candidate: candidate["content"],
         )
-        if is_semantically_in_range(draft, final["content"], lt=0.83, ut=0.92):
-            break
-        print(f"Attempt {attempt+1}: Different from draft, retrying...")
+    yield "stage", lap("final")
 
     metadata = extract_story_metadata(sketch, final["content"])
     final.update(metadata)
-    update_story_state_after_page(
-        story["story_id"], last_page["page_number"] + 1, final["content"], sketch
-    )
-
-    context_changes = get_context_changes(
-        story["story_id"], last_page["page_number"] + 1
-    )
+    yield "stage", lap("metadata")
 
-    return {
+    yield "result", {
         "content": final["content"],
         "metadata": final,  # includes prompt, version, etc.
         "new_characters": character_data,
-        "context_updates": context_changes,
+        "sketch": sketch,
+        "critique": critique,
+        "timings": timings,
     }
+
+
+def generate_next_page_pipeline(
+    story: dict,
+    last_page: dict,
+    character_context: str,
+    model: str = "llama3",
+    context: Optional[StoryContext] = None,
+) -> dict:
+    result = {}
+    for event, data in iter_next_page_pipeline(
+        story, last_page, character_context, model=model, context=context
+    ):
+        if event == "result":
+            result = data
+    return result
+
+
+def persist_next_page_state(
+    story_id: str,
+    page_number: int,
+    result: dict,
+    roster: Optional[CharacterRoster] = None,
+) -> Dict[str, Any]:
+    """
+    Write the story state derived from a stored page: the critique, new
+    character relationships, context, character states and events. Runs off
+    the request path; the next page for the story waits until it is done.
+    """
+    story_id = str(story_id)
+    roster = roster or CharacterRoster(story_id)
+    sketch = result["sketch"]
+
+    save_story_critique(
+        story_id,
+        page_number,
+        critique_type="continuity",
+        critique_content=result["critique"],
+        suggested_improvements=[],
+        severity_level=2,
+    )
+    for character in result.get("new_characters", []):
+        extract_and_save_new_relationships(story_id, character, sketch, roster=roster)
+
+    state = update_story_state_after_page(
+        story_id, page_number, result["content"], sketch, roster=roster
+    )
+    state["context_updates"] = get_context_changes(story_id, page_number)
+    print(f"Story state for {story_id} page {page_number}: {state}")
+    return state
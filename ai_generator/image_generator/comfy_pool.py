@@ -0,0 +1,195 @@
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+
+import websocket
+
+from config.config import settings
+from image_generator.tester import ComfyClient, ProgressCallback
+
+T = TypeVar("T")
+
+
+def _is_timeout(error: Exception) -> bool:
+    """A websocket recv or HTTP request that ran out of time, not a lost server."""
+    return isinstance(error, (TimeoutError, websocket.WebSocketTimeoutException)) or (
+        isinstance(error, urllib.error.URLError)
+        and isinstance(error.reason, TimeoutError)
+    )
+
+
+class ComfyServer:
+    def __init__(self, address: str, timeout: Optional[float]):
+        self.address = address
+        # One long-lived client (and websocket) per server, used by one render
+        # at a time so its websocket messages are never interleaved
+        self.client = ComfyClient(address, timeout=timeout)
+        self.lock = threading.Lock()
+        self.waiting = 0
+        self.down_until = 0.0
+        self.renders = 0
+        self.failures = 0
+
+
+class ComfyPool:
+    """
+    Sends workflows to several ComfyUI servers.
+
+    Each render goes to the server with the shortest queue, counting the
+    prompts on its /queue plus renders from this process waiting for it. A
+    server that fails is skipped for `retry_seconds` and the render moves on
+    to the next one; servers whose /queue cannot be read within
+    `probe_timeout` count as failed. The servers are probed in parallel.
+    A render that fails after its prompts were queued has them cancelled on
+    that server, then is sent again elsewhere. A render that times out also
+    moves on, but its server is busy rather than down, so it stays in use.
+    """
+
+    def __init__(
+        self,
+        servers: List[str],
+        timeout: Optional[float],
+        retry_seconds: float,
+        probe_timeout: Optional[float] = None,
+    ):
+        self.servers = [ComfyServer(address, timeout) for address in servers]
+        self.retry_seconds = retry_seconds
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+
+    def _mark_down(self, server: ComfyServer, error: Exception):
+        print(
+            f"[comfy] {server.address} failed, skipping for "
+            f"{self.retry_seconds:.0f}s: {error}"
+        )
+        server.client.close_ws()
+        with self._lock:
+            server.failures += 1
+            server.down_until = time.monotonic() + self.retry_seconds
+
+    def _probe(self, server: ComfyServer) -> Optional[int]:
+        try:
+            return server.client.get_queue_depth(timeout=self.probe_timeout)
+        except Exception as e:
+            self._mark_down(server, e)
+            return None
+
+    def _cancel_queued(self, server: ComfyServer):
+        """
+        Cancel the prompts a failed render left on `server`, so they don't run
+        there as well as on the server the render fails over to.
+        """
+        prompt_ids, server.client.active_prompts = server.client.active_prompts, []
+        if not prompt_ids:
+            return
+        try:
+            server.client.cancel_prompts(prompt_ids, timeout=self.probe_timeout)
+        except Exception as e:
+            print(f"[comfy] Could not cancel prompts on {server.address}: {e}")
+
+    def _queue_depths(self, exclude: set) -> Dict[ComfyServer, int]:
+        now = time.monotonic()
+        candidates = [
+            server
+            for server in self.servers
+            if server.address not in exclude and server.down_until <= now
+        ]
+        if len(candidates) > 1:
+            with ThreadPoolExecutor(max_workers=len(candidates)) as probes:
+                probed = list(probes.map(self._probe, candidates))
+        else:
+            probed = [self._probe(server) for server in candidates]
+
+        depths = {}
+        with self._lock:
+            for server, depth in zip(candidates, probed):
+                if depth is not None:
+                    depths[server] = depth + server.waiting
+        return depths
+
+    def _dispatch(self, render: Callable[[ComfyClient], T]) -> T:
+        """Run `render` with the client of the least busy server, with failover."""
+        tried = set()
+        while True:
+            depths = self._queue_depths(exclude=tried)
+            if not depths:
+                raise RuntimeError("No ComfyUI server available")
+            server = min(depths, key=depths.get)
+            tried.add(server.address)
+
+            with self._lock:
+                server.waiting += 1
+            try:
+                with server.lock:
+                    try:
+                        result = render(server.client)
+                    except Exception:
+                        self._cancel_queued(server)
+                        raise
+            except urllib.error.HTTPError:
+                # The server answered: the workflow itself was rejected
+                raise
+            except (OSError, websocket.WebSocketException) as e:
+                if not _is_timeout(e):
+                    self._mark_down(server, e)
+                    continue
+                print(f"[comfy] {server.address} timed out, trying another: {e}")
+                server.client.close_ws()
+                continue
+            finally:
+                with self._lock:
+                    server.waiting -= 1
+
+            with self._lock:
+                server.renders += 1
+            return result
+
+    def generate_images_many(
+        self,
+        workflows: List[dict],
+        on_progress: Optional[ProgressCallback] = None,
+        websocket_images: bool = False,
+    ) -> List[dict]:
+        """
+        ComfyClient.generate_images_many on the least busy server; the whole
+        batch stays on one server so it reuses that server's loaded model.
+        """
+        return self._dispatch(
+            lambda client: client.generate_images_many(
+                workflows, on_progress=on_progress, websocket_images=websocket_images
+            )
+        )
+
+    def stats(self) -> List[dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "server": s.address,
+                    "waiting": s.waiting,
+                    "down": s.down_until > now,
+                    "renders": s.renders,
+                    "failures": s.failures,
+                }
+                for s in self.servers
+            ]
+
+
+_pool: Optional[ComfyPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_comfy_pool() -> ComfyPool:
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ComfyPool(
+                [s.strip() for s in settings.COMFY_SERVERS.split(",") if s.strip()],
+                timeout=settings.COMFY_TIMEOUT_SECONDS,
+                retry_seconds=settings.COMFY_SERVER_RETRY_SECONDS,
+                probe_timeout=settings.COMFY_PROBE_TIMEOUT_SECONDS,
+            )
+        return _pool
@@ -1,21 +1,85 @@
+import copy
 import uuid
 import json
 import urllib.request
 import urllib.parse
+from typing import Callable, Dict, List, Optional
+
 import websocket
 
+# Binary websocket frames start with a 4-byte event type and a 4-byte image
+# format before the encoded image (SaveImageWebsocket output)
+WS_IMAGE_HEADER_SIZE = 8
+
+ProgressCallback = Callable[[dict], None]
+
+
+def use_websocket_output(workflow: dict) -> dict:
+    """
+    Copy of `workflow` whose SaveImage nodes send their images over the
+    websocket (SaveImageWebsocket) instead of writing files, and without
+    PreviewImage nodes.
+    """
+    workflow = copy.deepcopy(workflow)
+    for node_id, node in list(workflow.items()):
+        if node["class_type"] == "SaveImage":
+            node["class_type"] = "SaveImageWebsocket"
+            node["inputs"] = {"images": node["inputs"]["images"]}
+        elif node["class_type"] == "PreviewImage":
+            del workflow[node_id]
+    return workflow
+
+
 class ComfyClient:
-    def __init__(self, server: str):
+    def __init__(self, server: str, timeout: Optional[float] = None):
         self.server = server
+        self.timeout = timeout
         self.client_id = str(uuid.uuid4())
         self.ws = None
+        # Prompts queued by the current generate_images_many and not finished
+        self.active_prompts: List[str] = []
 
     def connect_ws(self):
         if self.ws is None or not self.ws.connected:
             self.ws = websocket.create_connection(
-                f"ws://{self.server}/ws?clientId={self.client_id}"
+                f"ws://{self.server}/ws?clientId={self.client_id}",
+                timeout=self.timeout,
             )
 
+    def close_ws(self):
+        if self.ws is not None:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+            self.ws = None
+
+    def get_queue(self, timeout: Optional[float] = None) -> dict:
+        """The server's /queue; `timeout` overrides the client timeout."""
+        with urllib.request.urlopen(
+            f"http://{self.server}/queue", timeout=timeout or self.timeout
+        ) as response:
+            return json.loads(response.read())
+
+    def get_queue_depth(self, timeout: Optional[float] = None) -> int:
+        """Prompts running plus waiting on the server."""
+        queue = self.get_queue(timeout)
+        return len(queue.get('queue_running', [])) + len(queue.get('queue_pending', []))
+
+    def _post(self, path: str, body: dict, timeout: Optional[float] = None) -> bytes:
+        req = urllib.request.Request(
+            f"http://{self.server}{path}", data=json.dumps(body).encode('utf-8')
+        )
+        with urllib.request.urlopen(req, timeout=timeout or self.timeout) as response:
+            return response.read()
+
+    def cancel_prompts(self, prompt_ids: List[str], timeout: Optional[float] = None):
+        """Delete the prompts from the server's queue and interrupt the running one."""
+        self._post("/queue", {"delete": prompt_ids}, timeout)
+        running = self.get_queue(timeout).get('queue_running', [])
+        for prompt_id in {entry[1] for entry in running}.intersection(prompt_ids):
+            self._post("/interrupt", {"prompt_id": prompt_id}, timeout)
+
     def queue_prompt(self, workflow: dict) -> str:
         payload = {"prompt": workflow, "client_id": self.client_id}
         data = json.dumps(payload).encode('utf-8')
@@ -24,15 +88,66 @@ class ComfyClient:
             resp_data = json.loads(response.read())
         return resp_data['prompt_id']
 
-    def wait_for_completion(self, prompt_id: str):
-        while True:
+    def wait_for_prompts(
+        self,
+        prompt_ids: List[str],
+        on_progress: Optional[ProgressCallback] = None,
+        image_nodes: Optional[set] = None,
+    ) -> Dict[str, dict]:
+        """
+        Read websocket messages until all the prompts finish. Sampler progress
+        is passed to `on_progress` as {"prompt_id", "index", "node", "step",
+        "steps"}, where index is the prompt's position in `prompt_ids`.
+        Binary frames received while one of `image_nodes` executes are
+        collected as images of the prompt that is executing.
+        Returns Dict[prompt_id] = Dict[node_id] = List[image_bytes].
+        """
+        pending = set(prompt_ids)
+        current = (None, None)  # (prompt_id, node) executing now
+        output_images = {prompt_id: {} for prompt_id in prompt_ids}
+
+        while pending:
             out = self.ws.recv()
             if isinstance(out, str):
                 message = json.loads(out)
+                data = message.get('data', {})
+                prompt_id = data.get('prompt_id')
+                if prompt_id not in pending:
+                    if message['type'] == 'executing':
+                        # Binary frames that follow are not ours
+                        current = (None, None)
+                    continue
                 if message['type'] == 'executing':
-                    data = message['data']
-                    if data['node'] is None and data['prompt_id'] == prompt_id:
-                        break
+                    if data['node'] is None:
+                        pending.discard(prompt_id)
+                    current = (prompt_id, data['node'])
+                elif message['type'] == 'execution_error':
+                    print(f"ComfyUI prompt {prompt_id} failed: {data.get('exception_message')}")
+                    pending.discard(prompt_id)
+                elif message['type'] == 'progress' and on_progress:
+                    on_progress({
+                        "prompt_id": prompt_id,
+                        "index": prompt_ids.index(prompt_id),
+                        "node": data.get('node'),
+                        "step": data['value'],
+                        "steps": data['max'],
+                    })
+            elif image_nodes and current[1] in image_nodes:
+                prompt_id, node_id = current
+                output_images[prompt_id].setdefault(node_id, []).append(
+                    out[WS_IMAGE_HEADER_SIZE:]
+                )
+
+        return output_images
+
+    def wait_for_completion(
+        self,
+        prompt_id: str,
+        on_progress: Optional[ProgressCallback] = None,
+        image_nodes: Optional[set] = None,
+    ) -> dict:
+        """wait_for_prompts for one prompt; returns Dict[node_id] = List[image_bytes]."""
+        return self.wait_for_prompts([prompt_id], on_progress, image_nodes)[prompt_id]
 
     def get_history(self, prompt_id: str) -> dict:
         with urllib.request.urlopen(f"http://{self.server}/history/{prompt_id}") as response:
@@ -47,18 +162,7 @@ class ComfyClient:
         with urllib.request.urlopen(f"http://{self.server}/view?{params}") as response:
             return response.read()
 
-    def generate_images(self, workflow: dict) -> dict:
-        """
-        1. Submit the workflow prompt
-        2. Wait for execution
-        3. Retrieve all generated images
-        Returns:
-            Dict[node_id] = List[image_bytes]
-        """
-        self.connect_ws()
-        prompt_id = self.queue_prompt(workflow)
-        self.wait_for_completion(prompt_id)
-
+    def get_history_images(self, prompt_id: str) -> dict:
         history = self.get_history(prompt_id)[prompt_id]
         output_images = {}
 
@@ -71,3 +175,56 @@ class ComfyClient:
                 output_images[node_id] = images_data
 
         return output_images
+
+    def generate_images_many(
+        self,
+        workflows: List[dict],
+        on_progress: Optional[ProgressCallback] = None,
+        websocket_images: bool = False,
+    ) -> List[dict]:
+        """
+        Queue all the workflows at once so ComfyUI runs them back to back on
+        the already loaded model, then collect their images. Returns one
+        Dict[node_id] = List[image_bytes] per workflow, in order; a workflow
+        that failed on the server gets an empty dict.
+        With websocket_images=True the SaveImage nodes are swapped for
+        SaveImageWebsocket and the images arrive as binary frames during
+        execution, skipping the /history and per-image /view requests.
+        """
+        self.connect_ws()
+
+        image_nodes = None
+        if websocket_images:
+            workflows = [use_websocket_output(w) for w in workflows]
+            image_nodes = {
+                node_id
+                for workflow in workflows
+                for node_id, node in workflow.items()
+                if node["class_type"] == "SaveImageWebsocket"
+            }
+
+        self.active_prompts = prompt_ids = []
+        for workflow in workflows:
+            prompt_ids.append(self.queue_prompt(workflow))
+        outputs = self.wait_for_prompts(prompt_ids, on_progress, image_nodes)
+        self.active_prompts = []
+
+        if websocket_images:
+            return [outputs[prompt_id] for prompt_id in prompt_ids]
+        return [self.get_history_images(prompt_id) for prompt_id in prompt_ids]
+
+    def generate_images(
+        self,
+        workflow: dict,
+        on_progress: Optional[ProgressCallback] = None,
+        websocket_images: bool = False,
+    ) -> dict:
+        """
+        1. Submit the workflow prompt
+        2. Wait for execution
+        3. Retrieve all generated images
+        See generate_images_many for websocket_images.
+        Returns:
+            Dict[node_id] = List[image_bytes]
+        """
+        return self.generate_images_many([workflow], on_progress, websocket_images)[0]
@@ -1,8 +1,13 @@
+import os
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from api.routes.jobs import job_router
+from api.routes.metrics import metrics_router
 from api.routes.stories import story_router
 import uvicorn
 from config.config import settings
+from utilities.write_spool import get_write_spool
 
 app = FastAPI()
 
@@ -15,12 +20,30 @@ app.add_middleware(
 )
 
 
+@app.on_event("startup")
+def replay_spooled_writes():
+    # Replay writes left in the spool by a previous run
+    get_write_spool().start()
+
+
+@app.on_event("startup")
+def warn_about_multiple_workers():
+    # Story-state writes are queued in process memory (services/write_behind)
+    if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        print(
+            "Warning: running with several workers; a next-page request served "
+            "by another worker may read story state that is still being written"
+        )
+
+
 @app.get("/")
 def read_root():
     return {"msg": "Good Stories backend is running"}
 
 
 app.include_router(story_router)
+app.include_router(job_router)
+app.include_router(metrics_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=settings.APP_PORT)
@@ -0,0 +1,35 @@
+from typing import Any, Dict, List
+from pydantic import BaseModel, Field
+
+
+class StoryContext(BaseModel):
+    """Everything the next-page pipeline reads from the database for a story."""
+
+    story: Dict[str, Any]
+    last_page: Dict[str, Any]
+    characters: List[Dict[str, Any]] = Field(default_factory=list)
+    character_prompt_block: str = ""
+    continuity_rules: List[Dict[str, Any]] = Field(default_factory=list)
+
+    story_summary: str = ""
+    current_location: str = ""
+    active_conflicts: List[str] = Field(default_factory=list)
+    character_states: Dict[str, Dict[str, Any]] = Field(default_factory=dict)
+    recent_events: List[Dict[str, Any]] = Field(default_factory=list)
+    relationship_tensions: List[Dict[str, Any]] = Field(default_factory=list)
+    mood_progression: str = ""
+
+    # Seconds: wall clock of the load, sum of per-query times, and the difference
+    timings: Dict[str, float] = Field(default_factory=dict)
+
+    def narrative_context(self) -> Dict[str, Any]:
+        """The fields build_rich_context_string formats for prompts."""
+        return {
+            "story_summary": self.story_summary,
+            "current_location": self.current_location,
+            "active_conflicts": self.active_conflicts,
+            "character_states": self.character_states,
+            "recent_events": self.recent_events,
+            "relationship_tensions": self.relationship_tensions,
+            "mood_progression": self.mood_progression,
+        }
@@ -0,0 +1,16 @@
+from datetime import datetime
+from typing import Dict, Optional
+from pydantic import BaseModel
+
+
+class CoverStatus(BaseModel):
+    story_id: str
+    status: str = "queued"  # queued | rendering | retrying | completed | failed
+    attempts: int = 0
+    step: int = 0  # sampler progress of the current attempt
+    steps: int = 0
+    cover_image_url: Optional[str] = None
+    cover_image_variants: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    queued_at: datetime
+    finished_at: Optional[datetime] = None
@@ -0,0 +1,24 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel, Field
+
+from schemas.story import StoryOut
+
+
+class JobStoryProgress(BaseModel):
+    index: int
+    status: str = "pending"  # pending | running | completed | failed
+    stages_completed: List[str] = Field(default_factory=list)
+    story: Optional[StoryOut] = None
+    error: Optional[str] = None
+
+
+class JobOut(BaseModel):
+    job_id: str
+    status: str = "pending"  # pending | running | completed | failed
+    count: int
+    completed: int = 0
+    failed: int = 0
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    stories: List[JobStoryProgress] = Field(default_factory=list)
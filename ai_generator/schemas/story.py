@@ -1,6 +1,6 @@
 from uuid import UUID
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 
@@ -59,3 +59,9 @@ class StoryPageOut(StoryPageBase):
 class FullStoryOut(BaseModel):
     metadata: StoryOut
     pages: List[StoryPageOut]
+
+
+class StoryBatchOut(BaseModel):
+    stories: List[StoryOut]
+    # Model swaps of the batched stage order vs. story-by-story generation
+    report: Dict[str, Any]
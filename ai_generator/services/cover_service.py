@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from config.config import settings
+from core.generator.image_pipeline import generate_and_upload_cover_images_batch
+from core.supabase_client import get_supabase_service
+from schemas.cover import CoverStatus
+from utilities.write_spool import spooled_write
+
+# Cover renders run here, off the story-creation path: stories are stored
+# with no cover and get cover_image_url once their render finishes. Each
+# worker lingers up to COVER_BATCH_LINGER_SECONDS for COVER_BATCH_SIZE covers,
+# then renders what is waiting as one pipelined ComfyUI batch, so covers
+# queued close together share warm-up and scheduling overhead. Status is kept
+# in this process only, like jobs.
+_covers: Dict[str, CoverStatus] = {}
+_covers_lock = threading.Lock()
+_pending: Deque[Tuple[CoverStatus, str]] = deque()
+_pending_ready = threading.Condition(_covers_lock)
+_workers: List[threading.Thread] = []
+
+
+def _prune_finished_covers():
+    now = datetime.now(timezone.utc)
+    with _covers_lock:
+        expired = [
+            story_id
+            for story_id, cover in _covers.items()
+            if cover.finished_at
+            and (now - cover.finished_at).total_seconds()
+            > settings.COVER_RETENTION_SECONDS
+        ]
+        for story_id in expired:
+            del _covers[story_id]
+
+
+def _queue(cover: CoverStatus, prompt: str):
+    with _pending_ready:
+        _pending.append((cover, prompt))
+        while len(_workers) < settings.COVER_WORKERS:
+            worker = threading.Thread(target=_run_worker, name="cover", daemon=True)
+            worker.start()
+            _workers.append(worker)
+        _pending_ready.notify()
+
+
+def _next_batch() -> List[Tuple[CoverStatus, str]]:
+    with _pending_ready:
+        deadline = None
+        while len(_pending) < settings.COVER_BATCH_SIZE:
+            if not _pending:
+                # Another worker may have taken what this one lingered for
+                deadline = None
+                _pending_ready.wait()
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + settings.COVER_BATCH_LINGER_SECONDS
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _pending_ready.wait(remaining)
+        size = min(len(_pending), settings.COVER_BATCH_SIZE)
+        batch = [_pending.popleft() for _ in range(size)]
+        for cover, _ in batch:
+            cover.status = "rendering"
+            cover.attempts += 1
+            cover.step = cover.steps = 0
+        return batch
+
+
+def _on_progress(story_id: str, progress: dict):
+    with _covers_lock:
+        cover = _covers.get(story_id)
+        if cover is not None:
+            cover.step, cover.steps = progress["step"], progress["steps"]
+
+
+def _retry_later(delay: float, fn, *args: Any):
+    retry = threading.Timer(delay, fn, args)
+    retry.daemon = True
+    retry.start()
+
+
+def _render_failed(cover: CoverStatus, prompt: str, error: Exception):
+    with _covers_lock:
+        print(f"[cover] Attempt {cover.attempts} for {cover.story_id} failed: {error}")
+        cover.error = str(error)
+        if cover.attempts >= settings.COVER_MAX_ATTEMPTS:
+            cover.status = "failed"
+            cover.finished_at = datetime.now(timezone.utc)
+            return
+        cover.status = "retrying"
+
+    backoff = settings.COVER_RETRY_BACKOFF_SECONDS * 2 ** (cover.attempts - 1)
+    _retry_later(backoff, _queue, cover, prompt)
+
+
+def _store_variants(
+    cover: CoverStatus, variants: Dict[str, str]
+) -> Optional[Dict[str, str]]:
+    """
+    Write cover_image_variants on its own, so a database without the column
+    (PGRST204) still keeps the cover. Returns the variants if they were stored.
+    """
+    try:
+        spooled_write(
+            "stories",
+            "update",
+            {"cover_image_variants": variants},
+            match={"story_id": cover.story_id},
+        )
+    except Exception as e:
+        print(f"[cover] Storing variants of {cover.story_id} failed: {e}")
+        return None
+    return variants
+
+
+def _store(cover: CoverStatus, columns: Dict[str, Any], attempt: int = 1):
+    """
+    Write a rendered cover's columns to its story. A failed write is retried
+    on its own with the uploaded URLs, so it never costs another render.
+    """
+    try:
+        spooled_write(
+            "stories",
+            "update",
+            {"cover_image_url": columns["cover_image_url"]},
+            match={"story_id": cover.story_id},
+        )
+    except Exception as e:
+        with _covers_lock:
+            print(f"[cover] Storing cover of {cover.story_id} failed: {e}")
+            cover.error = str(e)
+            if attempt >= settings.COVER_MAX_ATTEMPTS:
+                cover.status = "failed"
+                cover.finished_at = datetime.now(timezone.utc)
+                return
+            cover.status = "retrying"
+        backoff = settings.COVER_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1)
+        _retry_later(backoff, _store, cover, columns, attempt + 1)
+        return
+
+    variants = columns.get("cover_image_variants")
+    if variants:
+        variants = _store_variants(cover, variants)
+
+    with _covers_lock:
+        cover.status = "completed"
+        cover.cover_image_url = columns["cover_image_url"]
+        cover.cover_image_variants = variants
+        cover.error = None
+        cover.finished_at = datetime.now(timezone.utc)
+
+
+def _run_worker():
+    while True:
+        batch = _next_batch()
+        try:
+            results = generate_and_upload_cover_images_batch(
+                {cover.story_id: prompt for cover, prompt in batch},
+                supabase_client=get_supabase_service(),
+                bucket_name="cover-image",
+                on_progress=_on_progress,
+            )
+        except Exception as e:
+            results = {cover.story_id: e for cover, _ in batch}
+
+        for cover, prompt in batch:
+            result = results[cover.story_id]
+            if isinstance(result, Exception):
+                _render_failed(cover, prompt, result)
+            else:
+                _store(cover, result)
+
+
+def enqueue_cover(story_id: str, prompt: str) -> CoverStatus:
+    """Queue a cover render for a stored story and return its status."""
+    _prune_finished_covers()
+
+    cover = CoverStatus(story_id=str(story_id), queued_at=datetime.now(timezone.utc))
+    with _covers_lock:
+        _covers[cover.story_id] = cover
+        snapshot = cover.copy()
+
+    _queue(cover, prompt)
+    return snapshot
+
+
+def get_cover_status(story_id: str) -> Optional[CoverStatus]:
+    with _covers_lock:
+        cover = _covers.get(str(story_id))
+        return cover.copy() if cover else None
@@ -0,0 +1,101 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+from config.config import settings
+from core.generator.llm.scheduler import llm_priority
+from core.generator.story_pipeline import generate_full_story_pipeline
+from schemas.job import JobOut, JobStoryProgress
+from services.story_service import store_generated_story
+
+# Jobs live in this process only; the pool is shared by all jobs so at most
+# JOB_WORKERS stories are generated at once however many jobs are queued.
+_jobs: Dict[str, JobOut] = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(
+    max_workers=settings.JOB_WORKERS, thread_name_prefix="story-job"
+)
+
+
+def _prune_finished_jobs():
+    now = datetime.now(timezone.utc)
+    with _jobs_lock:
+        expired = [
+            job_id
+            for job_id, job in _jobs.items()
+            if job.finished_at
+            and (now - job.finished_at).total_seconds() > settings.JOB_RETENTION_SECONDS
+        ]
+        for job_id in expired:
+            del _jobs[job_id]
+
+
+def _update_job_status(job: JobOut):
+    """Recompute job counters; caller must hold _jobs_lock."""
+    job.completed = sum(1 for s in job.stories if s.status == "completed")
+    job.failed = sum(1 for s in job.stories if s.status == "failed")
+
+    if job.completed + job.failed == job.count:
+        job.status = "failed" if job.completed == 0 else "completed"
+        job.finished_at = datetime.now(timezone.utc)
+    elif any(s.status != "pending" for s in job.stories):
+        job.status = "running"
+
+
+def _run_story(job: JobOut, progress: JobStoryProgress):
+    with _jobs_lock:
+        progress.status = "running"
+        _update_job_status(job)
+
+    def on_stage(name: str, _elapsed: float):
+        with _jobs_lock:
+            progress.stages_completed.append(name)
+
+    try:
+        with llm_priority("batch"):
+            res, character_data, sketch, critique, prompt = (
+                generate_full_story_pipeline(on_stage=on_stage)
+            )
+        story = store_generated_story(res, character_data, sketch, critique, prompt)
+        with _jobs_lock:
+            progress.status = "completed"
+            progress.story = story
+    except Exception as e:
+        print(f"[job {job.job_id}] Story {progress.index} failed: {e}")
+        with _jobs_lock:
+            progress.status = "failed"
+            progress.error = str(e)
+
+    with _jobs_lock:
+        _update_job_status(job)
+
+
+def create_generation_job(count: int) -> JobOut:
+    """
+    Queue `count` story generations on the background pool and return the
+    job immediately. Work continues regardless of the client connection.
+    """
+    _prune_finished_jobs()
+
+    job = JobOut(
+        job_id=str(uuid.uuid4()),
+        count=count,
+        created_at=datetime.now(timezone.utc),
+        stories=[JobStoryProgress(index=i) for i in range(count)],
+    )
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+        snapshot = job.copy(deep=True)
+
+    for progress in job.stories:
+        _executor.submit(_run_story, job, progress)
+
+    return snapshot
+
+
+def get_job(job_id: str) -> Optional[JobOut]:
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return job.copy(deep=True) if job else None
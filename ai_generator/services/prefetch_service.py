@@ -0,0 +1,266 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+from uuid import UUID
+
+from config.config import settings
+from core.generator.llm.ollama_llm import llm_cancel_event
+from core.generator.llm.scheduler import llm_priority
+from core.generator.story_pipeline import generate_next_page_pipeline
+from services.write_behind import story_state_writer
+from utilities.context_loader import load_next_page_context
+
+GPU_BUDGET_WINDOW_SECONDS = 3600
+
+
+class PageBuffer:
+    """
+    Keeps up to `pages_ahead` next pages generated ahead for stories that
+    readers are actively reading.
+
+    Buffered pages are pipeline results that have not been stored yet; each
+    is tagged with the page number it continues from and is dropped if the
+    story moves on without it. Refills run on one background thread at the
+    "prefetch" LLM priority, only while the GPU seconds spent prefetching in
+    the last hour stay under the budget, and stories without a reader for
+    `idle_seconds` are evicted.
+    Pages after the first one ahead are generated from the narrative context
+    as of the latest stored page, since their predecessors' state is only
+    written once they are served. A reader who has to wait for a page still
+    being prefetched boosts its generation to interactive priority, and
+    after `wait_seconds` cancels it and generates the page itself.
+    `pages_ahead` of 0 disables prefetching.
+    """
+
+    def __init__(
+        self,
+        pages_ahead: int,
+        gpu_seconds_per_hour: float,
+        idle_seconds: float,
+        wait_seconds: float,
+    ):
+        self.pages_ahead = pages_ahead
+        self.gpu_seconds_per_hour = gpu_seconds_per_hour
+        self.idle_seconds = idle_seconds
+        self.wait_seconds = wait_seconds
+
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.discarded = 0
+        self.evicted = 0
+        self.abandoned = 0
+
+        # story_id -> [{"base_page_number": n, "result": pipeline result}, ...]
+        self._buffers: Dict[str, Deque[Dict[str, Any]]] = {}
+        self._last_read: Dict[str, float] = {}
+        # story_id -> (base page number, future done when that page is generated,
+        # event that boosts the generation to interactive priority, event that
+        # cancels it)
+        self._in_progress: Dict[
+            str, Tuple[int, Future, threading.Event, threading.Event]
+        ] = {}
+        self._gpu_spent: Deque[Tuple[float, float]] = deque()
+        self._lock = threading.Lock()
+
+        self._refills: "queue.Queue[str]" = queue.Queue()
+        self._queued: Set[str] = set()
+        self._worker: Optional[threading.Thread] = None
+
+    def record_activity(self, story_id: UUID):
+        with self._lock:
+            self._last_read[str(story_id)] = time.time()
+
+    def take(self, story_id: UUID, last_page_number: int) -> Optional[dict]:
+        """
+        Pop the buffered page that continues from `last_page_number`, waiting
+        up to `wait_seconds` for an in-progress prefetch of it if there is one.
+        A prefetch that takes longer is cancelled and the caller gets None, so
+        it generates the page inline.
+        """
+        if self.pages_ahead <= 0:
+            return None
+        story_id = str(story_id)
+        page = self._pop(story_id, last_page_number)
+        if page is None:
+            with self._lock:
+                base_page_number, in_progress, boost, cancel = self._in_progress.get(
+                    story_id, (None, None, None, None)
+                )
+            # A prefetch continuing from another page is of no use here
+            if in_progress is not None and base_page_number == last_page_number:
+                # A reader is waiting on it now, so it must not queue behind
+                # other readers' interactive calls
+                boost.set()
+                try:
+                    in_progress.result(timeout=self.wait_seconds)
+                    page = self._pop(story_id, last_page_number)
+                except FutureTimeoutError:
+                    print(f"[prefetch] Page for {story_id} is late, generating inline")
+                    cancel.set()
+                    with self._lock:
+                        self.abandoned += 1
+
+        with self._lock:
+            if page is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return page
+
+    def _pop(self, story_id: str, last_page_number: int) -> Optional[dict]:
+        with self._lock:
+            buffer = self._buffers.get(story_id)
+            if not buffer:
+                return None
+            if buffer[0]["base_page_number"] != last_page_number:
+                # The story moved on without these pages
+                self.discarded += len(buffer)
+                buffer.clear()
+                return None
+            return buffer.popleft()["result"]
+
+    def schedule_refill(self, story_id: UUID):
+        if self.pages_ahead <= 0:
+            return
+        story_id = str(story_id)
+        with self._lock:
+            if story_id in self._queued:
+                return
+            self._queued.add(story_id)
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._run, name="page-prefetch", daemon=True
+                )
+                self._worker.start()
+        self._refills.put(story_id)
+
+    def _budget_left(self) -> bool:
+        """Caller must hold _lock."""
+        cutoff = time.time() - GPU_BUDGET_WINDOW_SECONDS
+        while self._gpu_spent and self._gpu_spent[0][0] < cutoff:
+            self._gpu_spent.popleft()
+        return sum(s for _, s in self._gpu_spent) < self.gpu_seconds_per_hour
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.idle_seconds
+        with self._lock:
+            for story_id, last_read in list(self._last_read.items()):
+                if last_read < cutoff:
+                    self.evicted += len(self._buffers.pop(story_id, ()))
+                    del self._last_read[story_id]
+
+    def _run(self):
+        while True:
+            story_id = self._refills.get()
+            with self._lock:
+                self._queued.discard(story_id)
+            self._evict_idle()
+            try:
+                with llm_priority("prefetch"):
+                    self._refill(story_id)
+            except Exception as e:
+                print(f"[prefetch] Refill for {story_id} failed: {e}")
+
+    def _refill(self, story_id: str):
+        with self._lock:
+            if story_id not in self._last_read:
+                return
+            buffered = len(self._buffers.get(story_id, ()))
+        if buffered >= self.pages_ahead:
+            return
+
+        # The last served page's state must be written before reading context
+        story_state_writer.wait_for_story(story_id)
+        context = load_next_page_context(story_id)
+        last_page = context.last_page
+
+        with self._lock:
+            buffer = self._buffers.setdefault(story_id, deque())
+            if buffer and buffer[0]["base_page_number"] != last_page["page_number"]:
+                self.discarded += len(buffer)
+                buffer.clear()
+            if buffer:
+                tail = buffer[-1]
+                last_page = {
+                    **last_page,
+                    "page_number": tail["base_page_number"] + 1,
+                    "content": tail["result"]["content"],
+                }
+
+        while True:
+            with self._lock:
+                if (
+                    story_id not in self._last_read
+                    or len(self._buffers.get(story_id, ())) >= self.pages_ahead
+                ):
+                    return
+                if not self._budget_left():
+                    print("[prefetch] GPU budget used up, skipping refill")
+                    return
+                in_progress: Future = Future()
+                boost = threading.Event()
+                cancel = threading.Event()
+                self._in_progress[story_id] = (
+                    last_page["page_number"],
+                    in_progress,
+                    boost,
+                    cancel,
+                )
+
+            start = time.perf_counter()
+            try:
+                with llm_priority("prefetch", boost=boost), llm_cancel_event(cancel):
+                    result = generate_next_page_pipeline(
+                        context.story,
+                        last_page,
+                        context.character_prompt_block,
+                        context=context,
+                    )
+            finally:
+                spent = time.perf_counter() - start
+                with self._lock:
+                    self._gpu_spent.append((time.time(), spent))
+                    del self._in_progress[story_id]
+                in_progress.set_result(None)
+
+            with self._lock:
+                if story_id not in self._last_read:
+                    return
+                self._buffers.setdefault(story_id, deque()).append(
+                    {"base_page_number": last_page["page_number"], "result": result}
+                )
+                self.generated += 1
+
+            last_page = {
+                **last_page,
+                "page_number": last_page["page_number"] + 1,
+                "content": result["content"],
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._budget_left()
+            return {
+                "active_stories": len(self._last_read),
+                "buffered_pages": sum(len(b) for b in self._buffers.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+                "discarded": self.discarded,
+                "evicted": self.evicted,
+                "abandoned": self.abandoned,
+                "gpu_seconds_last_hour": sum(s for _, s in self._gpu_spent),
+                "gpu_seconds_budget": self.gpu_seconds_per_hour,
+            }
+
+
+page_buffer = PageBuffer(
+    pages_ahead=settings.PREFETCH_PAGES_AHEAD,
+    gpu_seconds_per_hour=settings.PREFETCH_GPU_SECONDS_PER_HOUR,
+    idle_seconds=settings.PREFETCH_IDLE_SECONDS,
+    wait_seconds=settings.PREFETCH_WAIT_SECONDS,
+)
@@ -1,31 +1,49 @@
+import contextvars
+import json
+import queue
+import threading
+import time
 from datetime import datetime, timezone, timedelta
-from uuid import UUID
+from uuid import UUID, uuid4
 
 from fastapi import HTTPException
 from core.generator.agents.continuation_agent import generate_next_page_text
-from core.generator.image_pipeline import generate_and_upload_cover_image_to_supabase
+from core.generator.batch_pipeline import generate_full_story_batch
+from core.generator.llm.scheduler import llm_priority
 from core.generator.prompt.continuation import continuation_prompt
 from core.generator.story_pipeline import (
     generate_full_story_pipeline,
     generate_next_page_pipeline,
+    iter_next_page_pipeline,
+    persist_next_page_state,
 )
-from core.supabase_client import get_supabase_client, get_supabase_service
+from config.config import settings
+from core.supabase_client import get_supabase_client
 from schemas.story import StoryOut, StoryPageOut
+from services.cover_service import enqueue_cover
+from services.prefetch_service import page_buffer
+from services.write_behind import story_state_writer
+from utilities.single_flight import SingleFlight
 
-from typing import List, Optional
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
+from utilities.character_roster import CharacterRoster
+from utilities.context_loader import load_next_page_context
 from utilities.supabase_helper import (
-    get_character_prompt_block,
-    get_latest_story_page,
+    get_story_page,
     save_characters_to_db,
     save_new_characters_to_db,
 )
+from utilities.write_spool import is_transient_error, spooled_write
 from utilities.utils import (
     save_initial_relationships,
     save_initial_story_context,
     save_story_critique,
 )
 
+# Next-page generations in flight, keyed by story id
+next_page_flights = SingleFlight()
+
 # New Funcs
 
 
@@ -77,87 +95,92 @@ def get_last_n_pages(story_id: UUID, n: int = 2) -> List[StoryPageOut]:
     return [StoryPageOut(**page) for page in reversed(res.data)]
 
 
-def generate_and_store_stories(count: int = 10) -> List[StoryOut]:
-    supabase = get_supabase_client()
-    supabase_service = get_supabase_service()
-    results = []
-
-    for _ in range(count):
-        res, character_data, sketch, critique, prompt = generate_full_story_pipeline()
-        story_data = res["metadata"]
-        page_1_content = res["content"]
+def store_generated_story(
+    res: dict, character_data: dict, sketch: str, critique: str, prompt: str
+) -> StoryOut:
+    story_data = res["metadata"]
+    page_1_content = res["content"]
 
-        story_data["created_at"] = datetime.now(timezone.utc).isoformat()
+    # The id is set here so the story and its rows can be spooled during an outage
+    story_data["story_id"] = str(uuid4())
+    story_data["created_at"] = datetime.now(timezone.utc).isoformat()
 
-        story_res = supabase.table("stories").insert(story_data).execute()
+    story_rows = spooled_write("stories", "insert", story_data)
+    story_id = story_data["story_id"]
 
-        if not story_res.data:
-            continue
+    # Rendered in the background; cover_image_url is set when it finishes
+    enqueue_cover(story_id, prompt)
 
-        story_id = story_res.data[0]["story_id"]
+    save_characters_to_db(
+        story_id,
+        character_data["main_characters"],
+        character_data["secondary_characters"],
+    )
 
-        cover_image_url = generate_and_upload_cover_image_to_supabase(
-            prompt_text=prompt,
-            supabase_client=supabase_service,
-            bucket_name="cover-image",
-            story_id=story_id,
-        )
+    save_initial_story_context(story_id, sketch, res["content"], character_data)
+    save_initial_relationships(story_id, character_data)
+    save_story_critique(
+        story_id,
+        page_number=1,
+        critique_type="continuity",
+        critique_content=critique,
+        suggested_improvements=[],
+        severity_level=2,
+    )
+    page_data = {
+        "story_id": story_id,
+        "page_number": 1,
+        "content": page_1_content,
+        "generation_prompt": story_data.get("seed_prompt", ""),
+        "model_used": story_data.get("model_used", "llama3"),
+        "version_number": 1,
+        "is_final_version": True,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+    }
+    spooled_write("story_pages", "insert", page_data)
 
-        supabase.table("stories").update({"cover_image_url": cover_image_url}).eq(
-            "story_id", story_id
-        ).execute()
+    return StoryOut(**(story_rows[0] if story_rows else story_data))
 
-        save_characters_to_db(
-            story_id,
-            character_data["main_characters"],
-            character_data["secondary_characters"],
-        )
 
-        save_initial_story_context(story_id, sketch, res["content"], character_data)
-        save_initial_relationships(story_id, character_data)
-        save_story_critique(
-            story_id,
-            page_number=1,
-            critique_type="continuity",
-            critique_content=critique,
-            suggested_improvements=[],
-            severity_level=2,
-        )
-        page_data = {
-            "story_id": story_id,
-            "page_number": 1,
-            "content": page_1_content,
-            "generation_prompt": story_data.get("seed_prompt", ""),
-            "model_used": story_data.get("model_used", "llama3"),
-            "version_number": 1,
-            "is_final_version": True,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-        }
-        supabase.table("story_pages").insert(page_data).execute()
+def generate_and_store_stories(
+    count: int = 10, batch: bool = False
+) -> Tuple[List[StoryOut], Optional[Dict[str, Any]]]:
+    """
+    Generate and store `count` stories. With `batch=True` all stories run
+    through the pipeline stage by stage, grouped by model, to avoid Ollama
+    model swaps; otherwise each story runs the full pipeline in turn.
+    Returns the stored stories and, in batch mode, the model-swap report.
+    """
+    results = []
+    report = None
 
-        results.append(StoryOut(**story_res.data[0]))
+    with llm_priority("batch"):
+        if batch:
+            generated, report = generate_full_story_batch(count)
+        else:
+            generated = (generate_full_story_pipeline() for _ in range(count))
 
-    return results
+        for res, character_data, sketch, critique, prompt in generated:
+            results.append(
+                store_generated_story(res, character_data, sketch, critique, prompt)
+            )
 
+    return results, report
 
-def generate_and_store_next_page(story_id: UUID) -> str:
-    supabase = get_supabase_client()
-    story = (
-        supabase.table("stories")
-        .select("*")
-        .eq("story_id", str(story_id))
-        .single()
-        .execute()
-        .data
-    )
-    last_page = get_latest_story_page(story_id)
-    character_context = get_character_prompt_block(story_id)
 
-    result = generate_next_page_pipeline(story, last_page, character_context)
+def store_next_page(
+    story_id: UUID,
+    story: dict,
+    last_page: dict,
+    result: dict,
+    roster: Optional[CharacterRoster] = None,
+) -> int:
     new_characters = result.get("new_characters", [])
     next_page_number = last_page["page_number"] + 1
 
-    supabase.table("story_pages").insert(
+    spooled_write(
+        "story_pages",
+        "insert",
         {
             "story_id": str(story_id),
             "page_number": next_page_number,
@@ -167,8 +190,8 @@ def generate_and_store_next_page(story_id: UUID) -> str:
             "version_number": 1,
             "is_final_version": True,
             "created_at": datetime.now(timezone.utc).isoformat(),
-        }
-    ).execute()
+        },
+    )
 
     update_data = {
         "current_page_number": next_page_number,
@@ -190,14 +213,241 @@ def generate_and_store_next_page(story_id: UUID) -> str:
             update_data[field] = result["metadata"][field]
 
     # Update stories table
-    supabase.table("stories").update(update_data).eq(
-        "story_id", str(story_id)
-    ).execute()
+    spooled_write("stories", "update", update_data, match={"story_id": str(story_id)})
 
     if len(new_characters) > 0:
-        save_new_characters_to_db(story_id=story_id, new_chars=new_characters)
+        save_new_characters_to_db(
+            story_id=story_id, new_chars=new_characters, roster=roster
+        )
+
+    return next_page_number
+
+
+def flush_story_state(story_id: UUID):
+    """
+    Wait until the previous page's state writes for this story are done.
+    Generating from half-written state would contradict it, so a flush that
+    times out fails the request instead.
+    """
+    if not story_state_writer.wait_for_story(
+        story_id, timeout=settings.STATE_FLUSH_TIMEOUT_SECONDS
+    ):
+        print(f"Timed out waiting for story {story_id} state")
+        raise HTTPException(
+            status_code=503,
+            detail="The previous page is still being saved; try again shortly",
+        )
+
+
+def _move_page_number(story_id: UUID, expected: Optional[int], page_number: int):
+    """Set stories.current_page_number only if it is still `expected`."""
+    query = (
+        get_supabase_client()
+        .table("stories")
+        .update({"current_page_number": page_number})
+        .eq("story_id", str(story_id))
+    )
+    if expected is None:
+        query = query.is_("current_page_number", "null")
+    else:
+        query = query.eq("current_page_number", expected)
+    return bool(query.execute().data)
+
 
-    return result["content"]
+def _current_page_number(story_id: UUID) -> Optional[int]:
+    res = (
+        get_supabase_client()
+        .table("stories")
+        .select("current_page_number")
+        .eq("story_id", str(story_id))
+        .limit(1)
+        .execute()
+    )
+    if not res.data:
+        raise HTTPException(status_code=404, detail="Story not found")
+    return res.data[0]["current_page_number"]
+
+
+def _wait_for_page(story_id: UUID, page_number: int) -> dict:
+    """Poll for the page another request claimed until it is stored."""
+    deadline = time.monotonic() + settings.PAGE_CLAIM_WAIT_SECONDS
+    while True:
+        page = get_story_page(story_id, page_number)
+        if page is not None:
+            return page
+        if time.monotonic() >= deadline:
+            raise HTTPException(
+                status_code=409,
+                detail="Another request is storing this page; try again shortly",
+            )
+        time.sleep(0.5)
+
+
+def claim_next_page(story_id: UUID, last_page_number: int) -> Optional[dict]:
+    """
+    Optimistically claim the next page number by moving
+    stories.current_page_number from the last page to the next one only if it
+    still points at the last page. Returns None when this caller may store the
+    page. A lost claim is final: the caller gets the page the winner stores
+    for that number (waiting for it if needed) and never stores its own.
+    A counter that lags behind the pages is moved from its current value.
+    """
+    next_page_number = last_page_number + 1
+    expected: Optional[int] = last_page_number
+    try:
+        while not _move_page_number(story_id, expected, next_page_number):
+            current = _current_page_number(story_id)
+            if current is not None and current > last_page_number:
+                break
+            expected = current
+        else:
+            return None
+    except Exception as e:
+        if isinstance(e, HTTPException) or not is_transient_error(e):
+            raise
+        # Can't check while Supabase is down; the page write gets spooled
+        print(f"Could not claim page for {story_id}, storing anyway: {e}")
+        return None
+
+    return _wait_for_page(story_id, next_page_number)
+
+
+def store_next_page_and_persist_state(
+    story_id: UUID,
+    story: dict,
+    last_page: dict,
+    result: dict,
+    roster: CharacterRoster,
+) -> dict:
+    """
+    Store the page text now and queue the derived state writes behind it.
+    If another worker already stored this page number, its page is returned
+    and this result is discarded.
+    """
+    winner = claim_next_page(story_id, last_page["page_number"])
+    if winner is not None:
+        print(f"Page {winner['page_number']} of {story_id} was stored concurrently")
+        return {"page_number": winner["page_number"], "content": winner["content"]}
+
+    page_number = store_next_page(story_id, story, last_page, result, roster=roster)
+    story_state_writer.submit(
+        story_id, persist_next_page_state, story_id, page_number, result, roster
+    )
+    return {"page_number": page_number, "content": result["content"]}
+
+
+def run_next_page_generation(story_id: UUID) -> dict:
+    page_buffer.record_activity(story_id)
+    flush_story_state(story_id)
+    context = load_next_page_context(story_id)
+    story, last_page = context.story, context.last_page
+    roster = CharacterRoster(story_id, rows=context.characters)
+
+    result = page_buffer.take(story_id, last_page["page_number"])
+    if result is None:
+        result = generate_next_page_pipeline(
+            story, last_page, context.character_prompt_block, context=context
+        )
+    page = store_next_page_and_persist_state(
+        story_id, story, last_page, result, roster
+    )
+    page_buffer.schedule_refill(story_id)
+    return page
+
+
+def generate_and_store_next_page(story_id: UUID) -> str:
+    """
+    Generate and store the next page. Concurrent requests for the same story
+    share one generation and all receive its page.
+    """
+    page = next_page_flights.do(str(story_id), run_next_page_generation, story_id)
+    return page["content"]
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def stream_and_store_next_page(story_id: UUID) -> Iterator[str]:
+    """
+    Generate and store the next page, yielding server-sent events: "stage"
+    progress, "token" chunks of the final text, "retry" when a streamed
+    attempt is discarded, then "done" with the stored page, or "error".
+    A page served from the prefetch buffer sends no tokens.
+    If a generation for this story is already running, the stream waits for
+    it and only sends its "done" event.
+
+    The generation runs on its own thread, so a client that disconnects does
+    not stop it: the page is still stored and any waiting streams get it.
+    """
+    flight, leader = next_page_flights.begin(str(story_id))
+    if not leader:
+        yield format_sse("stage", {"stage": "waiting"})
+        try:
+            yield format_sse("done", flight.result())
+        except Exception as e:
+            yield format_sse("error", {"detail": str(e)})
+        return
+
+    events: "queue.Queue[Optional[str]]" = queue.Queue()
+    threading.Thread(
+        target=contextvars.copy_context().run,
+        args=(_run_streamed_next_page, story_id, events.put),
+        name="next-page-stream",
+        daemon=True,
+    ).start()
+
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        yield event
+
+
+def _run_streamed_next_page(story_id: UUID, emit: Callable[[Optional[str]], None]):
+    """Leader side of stream_and_store_next_page; emits SSE strings, then None."""
+    page = None
+    error: Optional[BaseException] = None
+    try:
+        page_buffer.record_activity(story_id)
+        flush_story_state(story_id)
+        context = load_next_page_context(story_id)
+        story, last_page = context.story, context.last_page
+        roster = CharacterRoster(story_id, rows=context.characters)
+
+        prefetched = page_buffer.take(story_id, last_page["page_number"])
+        if prefetched is not None:
+            emit(format_sse("stage", {"stage": "prefetched"}))
+            events = iter([("result", prefetched)])
+        else:
+            events = iter_next_page_pipeline(
+                story,
+                last_page,
+                context.character_prompt_block,
+                stream=True,
+                context=context,
+            )
+
+        for event, data in events:
+            if event != "result":
+                emit(format_sse(event, data))
+                continue
+
+            page = store_next_page_and_persist_state(
+                story_id, story, last_page, data, roster
+            )
+            page_buffer.schedule_refill(story_id)
+            emit(format_sse("stage", {"stage": "stored"}))
+            emit(format_sse("done", page))
+        if page is None:
+            raise RuntimeError("Next page pipeline finished without a page")
+    except Exception as e:
+        error = e
+        print(f"Error streaming next page for {story_id}: {e}")
+        emit(format_sse("error", {"detail": str(e)}))
+    finally:
+        next_page_flights.finish(str(story_id), page, error)
+        emit(None)
 
 
 def start_of_today_utc():
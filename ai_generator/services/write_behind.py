@@ -0,0 +1,80 @@
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+from config.config import settings
+
+
+class StoryWriteBehind:
+    """
+    Background queue for story-state writes. Tasks for the same story run
+    one at a time in submission order; different stories run in parallel.
+    wait_for_story() blocks until everything queued for a story has run, so
+    readers can make sure they never load state a pending task will change.
+    Tasks run in a copy of the submitter's context.
+
+    The queue lives in this process's memory. That has two consequences:
+    - wait_for_story() only sees tasks submitted in the same process, so the
+      guarantee holds only while one process serves a story's next-page
+      requests. Another uvicorn worker could read state that is still
+      queued here.
+    - Tasks still queued when the process dies are lost. The rows a task
+      has already written are safe, because those go through the write
+      spool.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="story-state"
+        )
+        self._queues: Dict[
+            str, Deque[Tuple[contextvars.Context, Callable, tuple, dict, Future]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, story_id: str, fn: Callable, *args: Any, **kwargs: Any) -> Future:
+        story_id = str(story_id)
+        future: Future = Future()
+        with self._lock:
+            queue = self._queues.setdefault(story_id, deque())
+            queue.append((contextvars.copy_context(), fn, args, kwargs, future))
+            if len(queue) == 1:
+                self._executor.submit(self._drain, story_id)
+        return future
+
+    def _drain(self, story_id: str):
+        while True:
+            with self._lock:
+                ctx, fn, args, kwargs, future = self._queues[story_id][0]
+
+            try:
+                future.set_result(ctx.run(fn, *args, **kwargs))
+            except Exception as e:
+                print(f"Background state write for story {story_id} failed: {e}")
+                future.set_exception(e)
+
+            with self._lock:
+                queue = self._queues[story_id]
+                queue.popleft()
+                if not queue:
+                    del self._queues[story_id]
+                    return
+
+    def pending(self, story_id: str) -> int:
+        with self._lock:
+            return len(self._queues.get(str(story_id), ()))
+
+    def wait_for_story(self, story_id: str, timeout: Optional[float] = None) -> bool:
+        """Wait for the writes queued so far for a story. False on timeout."""
+        with self._lock:
+            futures = [item[4] for item in self._queues.get(str(story_id), ())]
+        if not futures:
+            return True
+        _, not_done = wait(futures, timeout=timeout)
+        return not not_done
+
+
+# Assumes a single app process (one uvicorn worker); see StoryWriteBehind
+story_state_writer = StoryWriteBehind(max_workers=settings.STATE_WRITER_WORKERS)
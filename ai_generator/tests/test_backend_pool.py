@@ -0,0 +1,149 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from ollama import Client
+
+from core.generator.llm.backend_pool import OllamaBackendPool
+
+
+class StandInOllama:
+    """A local HTTP server answering /api/generate like Ollama does."""
+
+    def __init__(self):
+        self.hits = []
+        self.fail = False
+        self.gate = threading.Event()
+        self.gate.set()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.hits.append(body["model"])
+                if stand_in.fail:
+                    data = json.dumps({"error": "model runner crashed"}).encode()
+                    self.send_response(500)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for response, done in (("Hello", False), ("", True)):
+                    line = json.dumps(
+                        {
+                            "model": body["model"],
+                            "created_at": "2024-01-01T00:00:00Z",
+                            "response": response,
+                            "done": done,
+                        }
+                    ).encode() + b"\n"
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+                    # Hold the stream open after the first chunk until released
+                    stand_in.gate.wait(5)
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def hosts():
+    servers = [StandInOllama(), StandInOllama()]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+def make_pool(backends, **kwargs):
+    options = dict(failure_threshold=2, reset_seconds=0.5, health_check_seconds=0)
+    options.update(kwargs)
+    return OllamaBackendPool(backends, **options)
+
+
+def generate(model):
+    def call(url):
+        return Client(host=url).generate(model=model, prompt="hi", stream=True)
+
+    return call
+
+
+def test_calls_go_to_the_hosts_their_model_is_placed_on(hosts):
+    a, b = hosts
+    pool = make_pool({a.url: {"gemma3:12b"}, b.url: {"mistral"}})
+
+    list(pool.stream("gemma3:12b", generate("gemma3:12b")))
+    list(pool.stream("mistral", generate("mistral")))
+
+    assert a.hits == ["gemma3:12b"]
+    assert b.hits == ["mistral"]
+    with pytest.raises(RuntimeError):
+        list(pool.stream("llama3", generate("llama3")))
+
+
+def test_call_goes_to_the_host_with_fewest_outstanding_requests(hosts):
+    a, b = hosts
+    pool = make_pool({a.url: None, b.url: None})
+
+    a.gate.clear()
+    b.gate.clear()
+    held = pool.stream("m", generate("m"))
+    next(held)
+    first = a if a.hits else b
+    other = b if first is a else a
+    assert [s["outstanding"] for s in pool.stats()] == [
+        1 if first is a else 0,
+        1 if first is b else 0,
+    ]
+
+    other.gate.set()
+    list(pool.stream("m", generate("m")))
+    assert (len(first.hits), len(other.hits)) == (1, 1)
+
+    first.gate.set()
+    list(held)
+    assert [s["outstanding"] for s in pool.stats()] == [0, 0]
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_a_good_trial(hosts):
+    a, b = hosts
+    pool = make_pool({a.url: None, b.url: None}, failure_threshold=2, reset_seconds=0.5)
+    a.fail = True
+
+    # Both calls fail over from a to b, which opens a's circuit
+    for _ in range(2):
+        assert [r["response"] for r in pool.stream("m", generate("m"))] == ["Hello", ""]
+    assert len(a.hits) == 2
+    assert pool.stats()[0]["circuit_open"]
+
+    # While open, a gets no traffic
+    list(pool.stream("m", generate("m")))
+    assert len(a.hits) == 2
+
+    # After the reset period one trial call goes to a; success closes it
+    a.fail = False
+    time.sleep(0.6)
+    list(pool.stream("m", generate("m")))
+    assert len(a.hits) == 3
+    stats = pool.stats()[0]
+    assert not stats["circuit_open"]
+    assert stats["consecutive_failures"] == 0
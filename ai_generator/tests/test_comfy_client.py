@@ -0,0 +1,190 @@
+import base64
+import hashlib
+import json
+import struct
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from image_generator.comfy_pool import ComfyPool
+from image_generator.tester import ComfyClient
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def ws_frame(payload, binary=False):
+    if isinstance(payload, str):
+        payload = payload.encode()
+    header = bytes([0x80 | (0x2 if binary else 0x1)])
+    if len(payload) < 126:
+        header += bytes([len(payload)])
+    else:
+        header += bytes([126]) + struct.pack(">H", len(payload))
+    return header + payload
+
+
+def ws_image(data):
+    # SaveImageWebsocket: event type PREVIEW_IMAGE (1), format PNG (2), image
+    return struct.pack(">II", 1, 2) + data
+
+
+class StandInComfy:
+    """
+    A local ComfyUI stand-in: /prompt hands out prompt ids, and /ws sends the
+    frames `script(prompt_ids)` returns once `expected_prompts` prompts are
+    queued. /queue is empty, or with `running=True` shows the first queued
+    prompt as running. Other POST bodies are recorded in `posts` by path.
+    """
+
+    def __init__(self, script, expected_prompts, running=False):
+        self.prompt_ids = []
+        self.posts = {}
+        self.all_queued = threading.Event()
+        self.closed = threading.Event()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, body):
+                data = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers["Content-Length"])
+                body = json.loads(self.rfile.read(length))
+                if self.path != "/prompt":
+                    stand_in.posts.setdefault(self.path, []).append(body)
+                    self._json({})
+                    return
+                prompt_id = f"prompt-{len(stand_in.prompt_ids) + 1}"
+                stand_in.prompt_ids.append(prompt_id)
+                if len(stand_in.prompt_ids) == expected_prompts:
+                    stand_in.all_queued.set()
+                self._json({"prompt_id": prompt_id})
+
+            def do_GET(self):
+                if self.path == "/queue":
+                    queued = [[n, p] for n, p in enumerate(stand_in.prompt_ids)]
+                    if not running:
+                        queued = []
+                    self._json(
+                        {"queue_running": queued[:1], "queue_pending": queued[1:]}
+                    )
+                    return
+
+                key = self.headers["Sec-WebSocket-Key"] + WS_GUID
+                accept = base64.b64encode(hashlib.sha1(key.encode()).digest())
+                self.send_response(101)
+                self.send_header("Upgrade", "websocket")
+                self.send_header("Connection", "Upgrade")
+                self.send_header("Sec-WebSocket-Accept", accept.decode())
+                self.end_headers()
+                self.wfile.flush()
+
+                stand_in.all_queued.wait(5)
+                for frame in script(stand_in.prompt_ids):
+                    self.wfile.write(frame)
+                    self.wfile.flush()
+                stand_in.closed.wait(5)
+                self.close_connection = True
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.address = f"127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.closed.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def message(type_, **data):
+    return ws_frame(json.dumps({"type": type_, "data": data}))
+
+
+def two_cover_script(prompt_ids):
+    first, second = prompt_ids
+    return [
+        message("executing", node="3", prompt_id=first),
+        message("progress", node="3", prompt_id=first, value=1, max=2),
+        # Another client's prompt on the same server
+        message("progress", node="3", prompt_id="someone-else", value=5, max=9),
+        message("executing", node="9", prompt_id=first),
+        ws_frame(ws_image(b"first-image"), binary=True),
+        message("executing", node="9", prompt_id="someone-else"),
+        ws_frame(ws_image(b"not-ours"), binary=True),
+        message("executing", node=None, prompt_id=first),
+        message("executing", node="9", prompt_id=second),
+        ws_frame(ws_image(b"second-image"), binary=True),
+        message("progress", node="3", prompt_id=second, value=2, max=2),
+        message("executing", node=None, prompt_id=second),
+    ]
+
+
+@pytest.fixture
+def comfy():
+    server = StandInComfy(two_cover_script, expected_prompts=2)
+    yield server
+    server.close()
+
+
+WORKFLOW = {
+    "3": {"class_type": "KSampler", "inputs": {}},
+    "9": {
+        "class_type": "SaveImage",
+        "inputs": {"images": ["8", 0], "filename_prefix": "cover"},
+    },
+}
+
+
+def test_websocket_images_are_split_per_prompt_with_progress(comfy):
+    client = ComfyClient(comfy.address, timeout=5)
+    progress = []
+
+    outputs = client.generate_images_many(
+        [WORKFLOW, WORKFLOW], on_progress=progress.append, websocket_images=True
+    )
+    client.close_ws()
+
+    # The 8-byte header is stripped, and frames sent while another prompt
+    # executes are dropped
+    assert outputs == [{"9": [b"first-image"]}, {"9": [b"second-image"]}]
+    assert progress == [
+        {"prompt_id": "prompt-1", "index": 0, "node": "3", "step": 1, "steps": 2},
+        {"prompt_id": "prompt-2", "index": 1, "node": "3", "step": 2, "steps": 2},
+    ]
+
+
+def test_pool_cancels_prompts_of_a_timed_out_server_and_fails_over(comfy):
+    stalled = StandInComfy(lambda prompt_ids: [], expected_prompts=2, running=True)
+    try:
+        pool = ComfyPool(
+            [stalled.address, comfy.address],
+            timeout=0.5,
+            retry_seconds=30,
+            probe_timeout=1,
+        )
+        outputs = pool.generate_images_many(
+            [WORKFLOW, WORKFLOW], websocket_images=True
+        )
+    finally:
+        stalled.close()
+
+    assert outputs == [{"9": [b"first-image"]}, {"9": [b"second-image"]}]
+    # Both prompts are dropped from the stalled server, the running one
+    # interrupted, and the server is busy rather than down
+    assert stalled.posts == {
+        "/queue": [{"delete": ["prompt-1", "prompt-2"]}],
+        "/interrupt": [{"prompt_id": "prompt-1"}],
+    }
+    assert [s["down"] for s in pool.stats()] == [False, False]
+    assert [s["renders"] for s in pool.stats()] == [0, 1]
@@ -0,0 +1,26 @@
+import io
+
+from PIL import Image, PngImagePlugin
+
+from core.generator.image_pipeline import strip_png_text
+
+
+def test_strip_png_text_drops_metadata_and_keeps_pixels():
+    info = PngImagePlugin.PngInfo()
+    info.add_text("prompt", '{"4": {"inputs": {"text": "a secret prompt"}}}')
+    info.add_itxt("workflow", '{"nodes": []}')
+    info.add_text("parameters", "compressed", zip=True)
+    img = Image.new("RGB", (8, 4), (200, 30, 90))
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", pnginfo=info)
+    png = buffer.getvalue()
+
+    stripped = strip_png_text(png)
+
+    assert b"secret prompt" in png
+    assert b"tEXt" not in stripped
+    assert b"iTXt" not in stripped
+    assert b"zTXt" not in stripped
+    decoded = Image.open(io.BytesIO(stripped))
+    assert decoded.text == {}
+    assert decoded.tobytes() == img.tobytes()
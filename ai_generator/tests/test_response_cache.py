@@ -0,0 +1,91 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.generator.llm.ollama_llm import ScheduledOllamaLLM
+from core.generator.llm.response_cache import SQLiteLLMCache
+
+
+class StandInOllama:
+    """Answers /api/generate with a JSON echo of the model and temperature."""
+
+    def __init__(self):
+        self.calls = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.calls += 1
+                answer = json.dumps(
+                    {
+                        "model": body["model"],
+                        "temperature": body["options"]["temperature"],
+                    }
+                )
+                data = json.dumps(
+                    {
+                        "model": body["model"],
+                        "created_at": "2024-01-01T00:00:00Z",
+                        "response": answer,
+                        "done": True,
+                    }
+                ).encode() + b"\n"
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def ollama():
+    server = StandInOllama()
+    yield server
+    server.close()
+
+
+def make_llm(url, cache, **params):
+    llm = ScheduledOllamaLLM(base_url=url, num_ctx=2048, cache=cache, **params)
+    llm._routed = False
+    return llm
+
+
+def test_differently_configured_llms_do_not_share_cache_entries(ollama, tmp_path):
+    cache = SQLiteLLMCache(
+        str(tmp_path / "cache.sqlite3"), max_bytes=1_000_000, ttl_seconds=0
+    )
+    mistral = make_llm(ollama.url, cache, model="mistral", temperature=0.1)
+    llama = make_llm(ollama.url, cache, model="llama3", temperature=0.3)
+    cooler_llama = make_llm(ollama.url, cache, model="llama3", temperature=0.1)
+
+    answers = [llm.invoke("Same prompt") for llm in (mistral, llama, cooler_llama)]
+
+    assert [json.loads(a) for a in answers] == [
+        {"model": "mistral", "temperature": 0.1},
+        {"model": "llama3", "temperature": 0.3},
+        {"model": "llama3", "temperature": 0.1},
+    ]
+    assert ollama.calls == 3
+
+    # An identically configured instance does hit the entry
+    assert make_llm(
+        ollama.url, cache, model="mistral", temperature=0.1
+    ).invoke("Same prompt") == answers[0]
+    assert ollama.calls == 3
+    assert cache.stats()["entries"] == 3
@@ -0,0 +1,130 @@
+import os
+
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+
+from utilities import write_spool
+from utilities.write_spool import WriteSpool, process_spool_path
+
+
+class FakeSupabase:
+    """Stands in for run_write: records entries, or fails while `error` is set."""
+
+    def __init__(self):
+        self.error = None
+        self.writes = []
+
+    def run_write(self, entry):
+        if self.error is not None:
+            raise self.error
+        self.writes.append((entry["table"], entry["op"], entry["payload"]))
+        return [entry["payload"]]
+
+
+@pytest.fixture
+def supabase(monkeypatch):
+    fake = FakeSupabase()
+    monkeypatch.setattr(write_spool, "run_write", fake.run_write)
+    return fake
+
+
+@pytest.fixture
+def spool_path(tmp_path):
+    return str(tmp_path / "write_spool.jsonl")
+
+
+def make_spool(path, pid):
+    spool = WriteSpool(path, batch_size=10, max_backoff=1, pid=pid)
+    # Replay is driven by the tests instead of a background thread
+    spool.start = lambda: None
+    return spool
+
+
+def drain(spool):
+    while spool._replay_once():
+        pass
+
+
+def test_writes_are_spooled_during_an_outage_and_replayed_in_order(
+    supabase, spool_path
+):
+    spool = make_spool(spool_path, pid=101)
+    supabase.error = httpx.ConnectError("connection refused")
+
+    assert spool.write("story_pages", "insert", {"page_number": 1}) is None
+    assert spool.write("story_pages", "insert", {"page_number": 2}) is None
+    assert spool.write(
+        "stories", "update", {"current_page_number": 2}, match={"story_id": "s"}
+    ) is None
+    assert spool.stats()["queue_depth"] == 3
+    with pytest.raises(httpx.ConnectError):
+        spool._replay_once()  # still down: nothing is dropped
+    assert spool.stats()["queue_depth"] == 3
+
+    supabase.error = None
+    drain(spool)
+
+    # The two inserts go out as one request, before the update
+    assert supabase.writes == [
+        ("story_pages", "insert", [{"page_number": 1}, {"page_number": 2}]),
+        ("stories", "update", {"current_page_number": 2}),
+    ]
+    assert spool.stats()["replayed"] == 3
+    assert os.path.getsize(spool.path) == 0
+    assert not os.path.exists(spool.offset_path)
+
+    # Drained, so writes run directly again
+    assert spool.write("story_pages", "insert", {"page_number": 3}) == [
+        {"page_number": 3}
+    ]
+
+
+def test_a_new_process_adopts_the_spool_of_one_that_exited(supabase, spool_path):
+    supabase.error = httpx.ConnectError("connection refused")
+    exited = make_spool(spool_path, pid=201)
+    exited.write("story_pages", "insert", {"page_number": 1})
+    exited.write("story_pages", "insert", {"page_number": 2})
+
+    # While its process holds the lock, the spool is left alone
+    running = make_spool(spool_path, pid=202)
+    assert running.stats()["queue_depth"] == 0
+    assert os.path.exists(process_spool_path(spool_path, 201))
+
+    exited._held_file.close()  # the process exits and its lock is released
+    adopter = make_spool(spool_path, pid=203)
+
+    assert [entry["payload"] for entry, _ in adopter._pending] == [
+        {"page_number": 1},
+        {"page_number": 2},
+    ]
+    assert not os.path.exists(process_spool_path(spool_path, 201))
+
+    supabase.error = None
+    drain(adopter)
+    assert supabase.writes == [
+        ("story_pages", "insert", [{"page_number": 1}, {"page_number": 2}])
+    ]
+
+
+def test_non_transient_errors_are_raised_not_spooled(supabase, spool_path):
+    spool = make_spool(spool_path, pid=301)
+    supabase.error = APIError(
+        {"code": "23505", "message": "duplicate key", "details": None, "hint": None}
+    )
+
+    with pytest.raises(APIError):
+        spool.write("story_pages", "insert", {"page_number": 1})
+
+    assert spool.stats()["queue_depth"] == 0
+    assert os.path.getsize(spool.path) == 0
+
+
+def test_transient_postgrest_errors_are_spooled(supabase, spool_path):
+    spool = make_spool(spool_path, pid=401)
+    supabase.error = APIError(
+        {"code": "PGRST002", "message": "schema cache", "details": None, "hint": None}
+    )
+
+    assert spool.write("story_pages", "insert", {"page_number": 1}) is None
+    assert spool.stats()["queue_depth"] == 1
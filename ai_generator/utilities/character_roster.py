@@ -0,0 +1,55 @@
+import threading
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+from core.supabase_client import get_supabase_client
+
+
+class CharacterRoster:
+    """
+    Request-scoped view of a story's story_characters rows.
+
+    The roster is read at most once (or seeded with rows that were already
+    loaded) and shared by every helper that needs character ids, names or
+    states during one request. Helpers that insert or update characters
+    report back through add() / update() so the cache stays consistent.
+    """
+
+    def __init__(self, story_id: UUID, rows: Optional[List[Dict[str, Any]]] = None):
+        self.story_id = str(story_id)
+        self._rows = list(rows) if rows is not None else None
+        self._lock = threading.Lock()
+
+    @property
+    def rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            if self._rows is None:
+                result = (
+                    get_supabase_client()
+                    .table("story_characters")
+                    .select("*")
+                    .eq("story_id", self.story_id)
+                    .execute()
+                )
+                self._rows = result.data or []
+            return list(self._rows)
+
+    def name_to_id(self) -> Dict[str, str]:
+        return {char["name"]: char["character_id"] for char in self.rows}
+
+    def main_characters(self) -> List[Dict[str, Any]]:
+        return [char for char in self.rows if char.get("is_main")]
+
+    def add(self, rows: List[Dict[str, Any]]):
+        """Record characters that were just inserted."""
+        self.rows  # make sure the existing roster is loaded first
+        with self._lock:
+            self._rows.extend(rows)
+
+    def update(self, character_id: str, changes: Dict[str, Any]):
+        """Record changes that were just written for one character."""
+        self.rows
+        with self._lock:
+            for char in self._rows:
+                if char["character_id"] == character_id:
+                    char.update(changes)
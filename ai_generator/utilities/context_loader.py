@@ -0,0 +1,165 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from core.supabase_client import get_supabase_client
+from schemas.context import StoryContext
+from utilities.supabase_helper import (
+    character_prompt_block_from_rows,
+    character_states_from_rows,
+    mood_timeline_from_rows,
+    relationship_issues_from_rows,
+    story_events_from_rows,
+)
+
+RECENT_EVENT_PAGES = 3
+
+# Queries the narrative context is built from. As with the sequential loader
+# this replaced, a failure in any of them leaves the narrative context empty
+# instead of failing the page.
+NARRATIVE_QUERIES = ("context_rows", "events", "relationships")
+
+
+def _context_queries(story_id: str) -> Dict[str, Callable[[], Any]]:
+    """
+    One query per table. story_context is read once and the location,
+    conflicts and mood timeline are derived from it, so no query depends on
+    another's result and all of them can be sent at once.
+    """
+    supabase = get_supabase_client()
+    return {
+        "story": lambda: supabase.table("stories")
+        .select("*")
+        .eq("story_id", story_id)
+        .single()
+        .execute()
+        .data,
+        "last_page": lambda: supabase.table("story_pages")
+        .select("*")
+        .eq("story_id", story_id)
+        .order("page_number", desc=True)
+        .limit(1)
+        .execute()
+        .data,
+        "characters": lambda: supabase.table("story_characters")
+        .select("*")
+        .eq("story_id", story_id)
+        .execute()
+        .data,
+        "context_rows": lambda: supabase.table("story_context")
+        .select(
+            "page_number, current_location, active_conflicts, unresolved_tensions, mood_atmosphere"
+        )
+        .eq("story_id", story_id)
+        .order("page_number")
+        .execute()
+        .data,
+        "events": lambda: supabase.table("story_events")
+        .select("event_description, characters_involved, consequences, page_number")
+        .eq("story_id", story_id)
+        .order("page_number", desc=True)
+        .limit(RECENT_EVENT_PAGES * 3)
+        .execute()
+        .data,
+        "relationships": lambda: supabase.table("character_relationships")
+        .select(
+            "character_1_id, character_2_id, relationship_type, unresolved_issues, relationship_status"
+        )
+        .eq("story_id", story_id)
+        .execute()
+        .data,
+        "rules": lambda: supabase.table("story_continuity")
+        .select("rule_type, rule_description, priority_level")
+        .eq("story_id", story_id)
+        .eq("is_active", True)
+        .order("priority_level")
+        .execute()
+        .data,
+    }
+
+
+def _timed(query: Callable[[], Any]) -> Tuple[Any, Optional[Exception], float]:
+    start = time.perf_counter()
+    try:
+        data, error = query(), None
+    except Exception as e:
+        data, error = None, e
+    return data, error, time.perf_counter() - start
+
+
+def load_next_page_context(story_id: UUID) -> StoryContext:
+    """
+    Load the story, its latest page, characters, continuity rules and the
+    narrative context in a single concurrent round of queries. Only the
+    story, page and character queries are required; failed rule or narrative
+    queries fall back to empty values.
+    """
+    queries = _context_queries(str(story_id))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(queries)) as pool:
+        futures = {name: pool.submit(_timed, query) for name, query in queries.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    wall = time.perf_counter() - start
+
+    data = {name: result[0] or [] for name, result in results.items()}
+    errors = {name: result[1] for name, result in results.items() if result[1]}
+    sequential = sum(result[2] for result in results.values())
+
+    for name in ("story", "last_page", "characters"):
+        if name in errors:
+            raise errors[name]
+    if "rules" in errors:
+        print(f"Error loading continuity rules: {errors['rules']}")
+    narrative_errors = [errors[name] for name in NARRATIVE_QUERIES if name in errors]
+
+    if not data["last_page"]:
+        raise Exception("No pages found for this story.")
+    last_page = data["last_page"][0]
+
+    context_rows: List[Dict] = data["context_rows"]
+    current_rows = [
+        row for row in context_rows if row["page_number"] == last_page["page_number"]
+    ]
+    latest_row = context_rows[-1] if context_rows else {}
+
+    story = data["story"]
+    summary = story.get("story_summary", "")
+    theme = story.get("main_theme", "")
+    character_prompt_block = character_prompt_block_from_rows(data["characters"])
+    timings = {
+        "context_load": wall,
+        "context_queries_sequential": sequential,
+        "context_latency_saved": max(sequential - wall, 0.0),
+    }
+
+    if narrative_errors:
+        print(f"Error loading context: {narrative_errors[0]}")
+        return StoryContext(
+            story=story,
+            last_page=last_page,
+            characters=data["characters"],
+            character_prompt_block=character_prompt_block,
+            continuity_rules=data["rules"],
+            timings=timings,
+        )
+
+    return StoryContext(
+        story=story,
+        last_page=last_page,
+        characters=data["characters"],
+        character_prompt_block=character_prompt_block,
+        continuity_rules=data["rules"],
+        story_summary=f"Theme: {theme}\nSummary: {summary}" if theme and summary else "",
+        current_location=(current_rows[0].get("current_location") or "")
+        if current_rows
+        else "",
+        active_conflicts=(latest_row.get("active_conflicts") or [])
+        + (latest_row.get("unresolved_tensions") or []),
+        character_states=character_states_from_rows(data["characters"]),
+        recent_events=story_events_from_rows(data["events"]),
+        relationship_tensions=relationship_issues_from_rows(data["relationships"]),
+        mood_progression=mood_timeline_from_rows(context_rows),
+        timings=timings,
+    )
@@ -0,0 +1,49 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls per key: the first caller for a key runs the
+    work, and callers arriving while it is in flight wait for, and share,
+    its result or exception.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key: str) -> Tuple[Future, bool]:
+        """
+        Join the flight for `key`. Returns the shared future and whether the
+        caller is the leader; the leader must call finish() exactly once.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            return future, True
+
+    def finish(
+        self, key: str, result: Any = None, error: Optional[BaseException] = None
+    ):
+        with self._lock:
+            future = self._flights.pop(key)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        future, leader = self.begin(key)
+        if leader:
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:
+                self.finish(key, error=e)
+                raise
+            self.finish(key, result)
+        return future.result()
@@ -1,7 +1,9 @@
-from typing import List, Dict
-from uuid import UUID
+from typing import List, Dict, Optional
+from uuid import UUID, uuid4
 from datetime import datetime, timezone
 from core.supabase_client import get_supabase_client
+from utilities.character_roster import CharacterRoster
+from utilities.write_spool import spooled_write
 
 
 def safe_int(value):
@@ -14,14 +16,13 @@ def safe_int(value):
 def save_characters_to_db(
     story_id: UUID, main_chars: List[Dict], secondary_chars: List[Dict]
 ):
-    supabase = get_supabase_client()
-
     character_rows = []
 
     # Main character (only one)
     for char in main_chars:
         character_rows.append(
             {
+                "character_id": str(uuid4()),
                 "story_id": str(story_id),
                 "name": char["name"],
                 "age": safe_int(char.get("age")),
@@ -44,6 +45,7 @@ def save_characters_to_db(
     for char in secondary_chars:
         character_rows.append(
             {
+                "character_id": str(uuid4()),
                 "story_id": str(story_id),
                 "name": char["name"],
                 "age": safe_int(char.get("age")),
@@ -63,18 +65,19 @@ def save_characters_to_db(
         )
 
     # Insert all at once
-    supabase.table("story_characters").insert(character_rows).execute()
-
+    spooled_write("story_characters", "insert", character_rows)
 
-def save_new_characters_to_db(story_id: UUID, new_chars: List[Dict]):
-    supabase = get_supabase_client()
 
+def save_new_characters_to_db(
+    story_id: UUID, new_chars: List[Dict], roster: Optional[CharacterRoster] = None
+):
     character_rows = []
 
     # Main character (only one)
     for char in new_chars:
         character_rows.append(
             {
+                "character_id": str(uuid4()),
                 "story_id": str(story_id),
                 "name": char["name"],
                 "age": safe_int(char.get("age")),
@@ -93,25 +96,20 @@ def save_new_characters_to_db(story_id: UUID, new_chars: List[Dict]):
             }
         )
 
-    # Insert all at once
-    supabase.table("story_characters").insert(character_rows).execute()
+    # Insert all at once; ids are set here so the roster is right even if spooled
+    spooled_write("story_characters", "insert", character_rows)
+    if roster is not None:
+        roster.add(character_rows)
 
 
-def get_character_prompt_block(story_id: UUID) -> str:
-    supabase = get_supabase_client()
-    response = (
-        supabase.table("story_characters")
-        .select("*")
-        .eq("story_id", str(story_id))
-        .execute()
-    )
-    if not response.data:
+def character_prompt_block_from_rows(rows: List[Dict]) -> str:
+    if not rows:
         return ""
 
     mains = []
     secondaries = []
 
-    for char in response.data:
+    for char in rows:
         line = f"{char['name']} ({char.get('age')}) - {char.get('role')}: {char.get('description')}"
         if char.get("is_main"):
             mains.append(f"- {line}")
@@ -121,19 +119,17 @@ def get_character_prompt_block(story_id: UUID) -> str:
     return f"""Main Characters:\n{chr(10).join(mains)}\n\nSecondary Characters:\n{chr(10).join(secondaries)}"""
 
 
-def get_latest_story_page(story_id: UUID) -> dict:
-    supabase = get_supabase_client()
+def get_story_page(story_id: UUID, page_number: int) -> Optional[dict]:
     result = (
-        supabase.table("story_pages")
+        get_supabase_client()
+        .table("story_pages")
         .select("*")
         .eq("story_id", str(story_id))
-        .order("page_number", desc=True)
+        .eq("page_number", page_number)
         .limit(1)
         .execute()
     )
-    if not result.data:
-        raise Exception("No pages found for this story.")
-    return result.data[0]
+    return result.data[0] if result.data else None
 
 
 from typing import Dict, List, Any, Optional
@@ -141,72 +137,10 @@ import json
 from utilities.supabase_helper import get_supabase_client
 
 
-def get_story_summary(story_id: str) -> str:
-    """Get the main story summary and theme."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("stories")
-        .select("story_summary, main_theme")
-        .eq("story_id", story_id)
-        .single()
-        .execute()
-    )
-    if result.data:
-        summary = result.data.get("story_summary", "")
-        theme = result.data.get("main_theme", "")
-        return f"Theme: {theme}\nSummary: {summary}" if theme and summary else ""
-    return ""
-
-
-def get_current_location(story_id: str, page_number: int) -> str:
-    """Get the current story location."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("story_context")
-        .select("current_location")
-        .eq("story_id", story_id)
-        .eq("page_number", page_number)
-        .single()
-        .execute()
-    )
-    if result.data:
-        return result.data.get("current_location", "")
-    return ""
-
-
-def get_unresolved_conflicts(story_id: str) -> List[str]:
-    """Get active conflicts that need resolution."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("story_context")
-        .select("active_conflicts, unresolved_tensions")
-        .eq("story_id", story_id)
-        .order("page_number", desc=True)
-        .limit(1)
-        .execute()
-    )
-    if result.data:
-        conflicts = result.data[0].get("active_conflicts", [])
-        tensions = result.data[0].get("unresolved_tensions", [])
-        return conflicts + tensions
-    return []
-
-
-def get_all_character_current_states(story_id: str) -> Dict[str, Dict]:
-    """Get current emotional and motivational state of all characters."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("story_characters")
-        .select(
-            "name, current_emotional_state, core_desire, deepest_fear, character_arc_stage, last_action"
-        )
-        .eq("story_id", story_id)
-        .execute()
-    )
-
+def character_states_from_rows(rows: List[Dict]) -> Dict[str, Dict]:
     characters = {}
-    if result.data:
-        for char in result.data:
+    if rows:
+        for char in rows:
             characters[char["name"]] = {
                 "emotional_state": char.get("current_emotional_state", ""),
                 "desire": char.get("core_desire", ""),
@@ -217,21 +151,10 @@ def get_all_character_current_states(story_id: str) -> Dict[str, Dict]:
     return characters
 
 
-def get_recent_story_events(story_id: str, last_n_pages: int = 3) -> List[Dict]:
-    """Get recent story events for context."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("story_events")
-        .select("event_description, characters_involved, consequences, page_number")
-        .eq("story_id", story_id)
-        .order("page_number", desc=True)
-        .limit(last_n_pages * 3)
-        .execute()
-    )
-
+def story_events_from_rows(rows: List[Dict]) -> List[Dict]:
     events = []
-    if result.data:
-        for event in result.data:
+    if rows:
+        for event in rows:
             events.append(
                 {
                     "description": event.get("event_description", ""),
@@ -243,21 +166,10 @@ def get_recent_story_events(story_id: str, last_n_pages: int = 3) -> List[Dict]:
     return events
 
 
-def get_relationship_issues(story_id: str) -> List[Dict]:
-    """Get unresolved relationship tensions."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("character_relationships")
-        .select(
-            "character_1_id, character_2_id, relationship_type, unresolved_issues, relationship_status"
-        )
-        .eq("story_id", story_id)
-        .execute()
-    )
-
+def relationship_issues_from_rows(rows: List[Dict]) -> List[Dict]:
     issues = []
-    if result.data:
-        for rel in result.data:
+    if rows:
+        for rel in rows:
             if rel.get("unresolved_issues"):
                 issues.append(
                     {
@@ -273,21 +185,11 @@ def get_relationship_issues(story_id: str) -> List[Dict]:
     return issues
 
 
-def get_mood_timeline(story_id: str) -> str:
-    """Get the emotional progression of the story."""
-    supabase = get_supabase_client()
-    result = (
-        supabase.table("story_context")
-        .select("mood_atmosphere, page_number")
-        .eq("story_id", story_id)
-        .order("page_number")
-        .execute()
-    )
-
-    if result.data:
+def mood_timeline_from_rows(rows: List[Dict]) -> str:
+    if rows:
         moods = [
             f"Page {item['page_number']}: {item.get('mood_atmosphere', '')}"
-            for item in result.data
+            for item in rows
             if item.get("mood_atmosphere")
         ]
         return " -> ".join(moods[-3:])  # Last 3 mood changes
@@ -1,49 +1,31 @@
-from typing import Any, Dict, Optional
-from sentence_transformers import SentenceTransformer, util
+from typing import Any, Dict, List, Optional
 
+from core.embedding_service import cosine_similarity_matrix, get_embedding_cache
 from core.generator.agents.event_extraction_agent import extract_story_events_from_text
 from core.supabase_client import get_supabase_client
-from utilities.supabase_helper import (
-    get_current_location,
-    get_story_summary,
-    get_unresolved_conflicts,
-    get_all_character_current_states,
-    get_relationship_issues,
-    get_recent_story_events,
-    get_mood_timeline,
-)
+from utilities.character_roster import CharacterRoster
+from utilities.write_spool import spooled_write
 
-similarity_model = SentenceTransformer("all-MiniLM-L6-v2")  # light + fast
+
+def score_similarities(reference: str, candidates: List[str]) -> List[float]:
+    """
+    Cosine similarity of each candidate to the reference text, computed from a
+    single encode call. Texts already seen are served from the embedding cache.
+    """
+    if not candidates:
+        return []
+    embeddings = get_embedding_cache().encode([reference] + list(candidates))
+    return cosine_similarity_matrix(embeddings[:1], embeddings[1:])[0].tolist()
 
 
 def is_semantically_in_range(
     text1: str, text2: str, lt: float = 0.75, ut: float = 0.92
 ) -> bool:
-    emb1 = similarity_model.encode(text1, convert_to_tensor=True)
-    emb2 = similarity_model.encode(text2, convert_to_tensor=True)
-    similarity = util.pytorch_cos_sim(emb1, emb2).item()
+    similarity = score_similarities(text1, [text2])[0]
     print(f"Similarity score: {similarity:.4f}")
     return lt < similarity < ut
 
 
-def load_comprehensive_context(story_id: str, page_number: int) -> Dict[str, Any]:
-    """Load all relevant context for story continuation."""
-    try:
-        context = {
-            "story_summary": get_story_summary(story_id),
-            "current_location": get_current_location(story_id, page_number),
-            "active_conflicts": get_unresolved_conflicts(story_id),
-            "character_states": get_all_character_current_states(story_id),
-            "recent_events": get_recent_story_events(story_id, last_n_pages=3),
-            "relationship_tensions": get_relationship_issues(story_id),
-            "mood_progression": get_mood_timeline(story_id),
-        }
-        return context
-    except Exception as e:
-        print(f"Error loading context: {e}")
-        return {}
-
-
 def build_rich_context_string(context: Dict[str, Any]) -> str:
     """Convert context dictionary to formatted string for LLM prompts."""
     context_parts = []
@@ -227,8 +209,6 @@ def save_story_context(
 ) -> bool:
     """Save story context to database."""
     try:
-        supabase = get_supabase_client()
-
         context_data = {
             "story_id": story_id,
             "page_number": page_number,
@@ -241,34 +221,27 @@ def save_story_context(
             "pacing_notes": extract_pacing_notes_from_sketch(sketch),
         }
 
-        result = supabase.table("story_context").upsert(context_data).execute()
-        return result.data is not None
+        spooled_write("story_context", "upsert", context_data)
+        return True
     except Exception as e:
         print(f"Error saving story context: {e}")
         return False
 
 
-def save_story_events(story_id: str, page_number: int, content: str) -> bool:
+def save_story_events(
+    story_id: str,
+    page_number: int,
+    content: str,
+    roster: Optional[CharacterRoster] = None,
+) -> bool:
     """Save story events to database."""
     try:
         events = extract_story_events(content, page_number)
         print(f"Events: {events}")
         if not events:
             return True
-        supabase = get_supabase_client()
-
-        character_result = (
-            supabase.table("story_characters")
-            .select("character_id, name")
-            .eq("story_id", story_id)
-            .execute()
-        )
 
-        character_map = (
-            {c["name"]: c["character_id"] for c in character_result.data}
-            if character_result.data
-            else {}
-        )
+        character_map = (roster or CharacterRoster(story_id)).name_to_id()
 
         for event in events:
             name_list = event.get("characters_involved", [])
@@ -278,45 +251,70 @@ def save_story_events(story_id: str, page_number: int, content: str) -> bool:
             event["characters_involved"] = uuid_list
             event["story_id"] = story_id
 
-        result = supabase.table("story_events").insert(events).execute()
-        return result.data is not None
+        spooled_write("story_events", "insert", events)
+        return True
     except Exception as e:
         print(f"Error saving story events: {e}")
         return False
 
 
-def update_character_emotional_progression(story_id: str, sketch: str) -> bool:
-    """Update character emotional states based on sketch."""
+def update_character_emotional_progression(
+    story_id: str, sketch: str, roster: Optional[CharacterRoster] = None
+) -> int:
+    """
+    Update character emotional states based on sketch. All changed
+    characters are written in one bulk upsert of their identity columns plus
+    the two progression columns, never the rest of their cached rows;
+    characters whose state is unchanged are skipped. Returns the number of
+    rows written.
+    """
     try:
-        supabase = get_supabase_client()
+        roster = roster or CharacterRoster(story_id)
 
         # Get existing characters
-        characters = (
-            supabase.table("story_characters")
-            .select("character_id, name")
-            .eq("story_id", story_id)
-            .execute()
-        )
-
-        if not characters.data:
-            return True
+        characters = roster.rows
 
-        for char in characters.data:
+        changed_rows = []
+        for char in characters:
             new_emotional_state = extract_emotional_state(sketch, char["name"])
             if new_emotional_state and new_emotional_state != "uncertain":
                 update_data = {
                     "current_emotional_state": new_emotional_state,
                     "character_arc_stage": determine_arc_stage(sketch, char["name"]),
                 }
+                if all(char.get(k) == v for k, v in update_data.items()):
+                    continue
+                # story_id and name never change; they satisfy the NOT NULL
+                # columns on the upsert's insert path
+                changed_rows.append(
+                    {
+                        "character_id": char["character_id"],
+                        "story_id": str(story_id),
+                        "name": char["name"],
+                        **update_data,
+                    }
+                )
 
-                supabase.table("story_characters").update(update_data).eq(
-                    "character_id", char["character_id"]
-                ).execute()
+        if not changed_rows:
+            return 0
 
-        return True
+        spooled_write(
+            "story_characters", "upsert", changed_rows, on_conflict="character_id"
+        )
+
+        for row in changed_rows:
+            roster.update(
+                row["character_id"],
+                {
+                    "current_emotional_state": row["current_emotional_state"],
+                    "character_arc_stage": row["character_arc_stage"],
+                },
+            )
+
+        return len(changed_rows)
     except Exception as e:
         print(f"Error updating character progression: {e}")
-        return False
+        return 0
 
 
 def determine_arc_stage(sketch: str, character_name: str) -> str:
@@ -348,8 +346,6 @@ def save_story_critique(
     Save a single critique entry to the story_critique table.
     """
     try:
-        supabase = get_supabase_client()
-
         data = {
             "story_id": story_id,
             "page_number": page_number,
@@ -360,8 +356,8 @@ def save_story_critique(
             "is_resolved": False,
         }
 
-        result = supabase.table("story_critique").insert(data).execute()
-        return result.data is not None
+        spooled_write("story_critique", "insert", data)
+        return True
 
     except Exception as e:
         print(f"Error saving critique: {e}")
@@ -409,7 +405,7 @@ def save_initial_relationships(story_id: str, character_data: Dict) -> bool:
                 )
 
         if relationships:
-            supabase.table("character_relationships").insert(relationships).execute()
+            spooled_write("character_relationships", "insert", relationships)
 
         return True
 
@@ -419,45 +415,38 @@ def save_initial_relationships(story_id: str, character_data: Dict) -> bool:
 
 
 def extract_and_save_new_relationships(
-    story_id: str, new_characters: Dict, sketch: str
+    story_id: str,
+    new_characters: Dict,
+    sketch: str,
+    roster: Optional[CharacterRoster] = None,
 ) -> bool:
     """Extract and save new character relationships."""
     try:
         if not new_characters.get("new_characters"):
             return True
 
-        supabase = get_supabase_client()
-
-        # Get existing characters
-        existing_chars = (
-            supabase.table("story_characters")
-            .select("character_id, name")
-            .eq("story_id", story_id)
-            .execute()
-        )
-        existing_char_map = (
-            {char["name"]: char["character_id"] for char in existing_chars.data}
-            if existing_chars.data
-            else {}
-        )
+        roster = roster or CharacterRoster(story_id)
+        # New characters were added to the roster when they were inserted
+        name_to_id = roster.name_to_id()
 
         relationships = []
         for new_char in new_characters["new_characters"]:
             if new_char.get("relationship_to_main"):
+                character_id = name_to_id.get(new_char.get("name"))
+                if character_id is None:
+                    print(
+                        f"No stored character named {new_char.get('name')!r} "
+                        f"in story {story_id}; skipping its relationship"
+                    )
+                    continue
                 # Find main character
-                main_chars = (
-                    [char for char in existing_chars.data if char.get("is_main")]
-                    if existing_chars.data
-                    else []
-                )
+                main_chars = roster.main_characters()
                 if main_chars:
                     relationships.append(
                         {
                             "story_id": story_id,
                             "character_1_id": main_chars[0]["character_id"],
-                            "character_2_id": new_char.get(
-                                "character_id"
-                            ),  # Assuming this is set
+                            "character_2_id": character_id,
                             "relationship_type": new_char["relationship_to_main"],
                             "relationship_strength": 5,  # Default
                             "relationship_status": "developing",
@@ -465,12 +454,8 @@ def extract_and_save_new_relationships(
                     )
 
         if relationships:
-            result = (
-                supabase.table("character_relationships")
-                .insert(relationships)
-                .execute()
-            )
-            return result.data is not None
+            spooled_write("character_relationships", "insert", relationships)
+            return True
 
         return True
     except Exception as e:
@@ -479,56 +464,43 @@ def extract_and_save_new_relationships(
 
 
 def update_story_state_after_page(
-    story_id: str, page_number: int, content: str, sketch: str = ""
-) -> Dict[str, bool]:
-    """Update all story state after page generation."""
+    story_id: str,
+    page_number: int,
+    content: str,
+    sketch: str = "",
+    roster: Optional[CharacterRoster] = None,
+) -> Dict[str, Any]:
+    """
+    Update all story state after page generation. "characters_updated" is the
+    number of character rows whose state changed.
+    """
     results = {
         "context_saved": False,
         "events_saved": False,
-        "characters_updated": False,
+        "characters_updated": 0,
     }
+    roster = roster or CharacterRoster(story_id)
 
     if sketch:
         results["context_saved"] = save_story_context(
             story_id, page_number, sketch, content
         )
         results["characters_updated"] = update_character_emotional_progression(
-            story_id, sketch
+            story_id, sketch, roster=roster
         )
 
-    results["events_saved"] = save_story_events(story_id, page_number, content)
+    results["events_saved"] = save_story_events(
+        story_id, page_number, content, roster=roster
+    )
 
     return results
 
 
-def load_story_continuity_rules(story_id: str) -> List[Dict[str, Any]]:
-    """Load active continuity rules for story."""
-    try:
-        supabase = get_supabase_client()
-        result = (
-            supabase.table("story_continuity")
-            .select("rule_type, rule_description, priority_level")
-            .eq("story_id", story_id)
-            .eq("is_active", True)
-            .order("priority_level")
-            .execute()
-        )
-
-        if result.data:
-            return result.data
-        return []
-    except Exception as e:
-        print(f"Error loading continuity rules: {e}")
-        return []
-
-
 def save_continuity_rule(
     story_id: str, rule_type: str, rule_description: str, priority: int = 2
 ) -> bool:
     """Save a new continuity rule."""
     try:
-        supabase = get_supabase_client()
-
         rule_data = {
             "story_id": story_id,
             "rule_type": rule_type,
@@ -537,8 +509,8 @@ def save_continuity_rule(
             "is_active": True,
         }
 
-        result = supabase.table("story_continuity").insert(rule_data).execute()
-        return result.data is not None
+        spooled_write("story_continuity", "insert", rule_data)
+        return True
     except Exception as e:
         print(f"Error saving continuity rule: {e}")
         return False
@@ -0,0 +1,447 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from postgrest.exceptions import APIError
+
+from config.config import settings
+from core.supabase_client import get_supabase_client
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Windows locks are mandatory, so lock one byte far past any real spool
+# content; that way the lock never blocks reading or appending the file.
+_WINDOWS_LOCK_OFFSET = 2**30
+
+_TRANSIENT_ERROR_CODES = {
+    # PostgREST: could not reach / connect to the database
+    "PGRST000",
+    "PGRST001",
+    "PGRST002",
+    "PGRST003",
+    # Postgres: connection exceptions
+    "08000",
+    "08001",
+    "08003",
+    "08004",
+    "08006",
+    # Postgres: serialization failure, deadlock
+    "40001",
+    "40P01",
+    # Postgres: out of resources, too many connections
+    "53000",
+    "53300",
+    # Postgres: statement timeout, shutting down, starting up
+    "57014",
+    "57P01",
+    "57P02",
+    "57P03",
+    # HTTP statuses from the gateway, which answers without a PostgREST body
+    "429",
+    "502",
+    "503",
+    "504",
+}
+
+
+def is_transient_error(e: Exception) -> bool:
+    """True for errors worth retrying later: network failures and outages."""
+    if isinstance(e, (httpx.TransportError, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(e, APIError):
+        return str(e.code or "") in _TRANSIENT_ERROR_CODES
+    return False
+
+
+def process_spool_path(path: str, pid: int) -> str:
+    """The spool file of process `pid`, e.g. "write_spool.<pid>.jsonl"."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pid}{ext}"
+
+
+def _lock_file(f: BinaryIO, blocking: bool) -> bool:
+    """Take an exclusive lock on an open file; False if another process has it."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            return False
+        return True
+
+    f.seek(_WINDOWS_LOCK_OFFSET)
+    try:
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _read_spool(path: str) -> List[Tuple[Dict[str, Any], int]]:
+    """Entries of a spool file not yet replayed, with their end offsets."""
+    offset = 0
+    if os.path.exists(f"{path}.offset"):
+        with open(f"{path}.offset", "r", encoding="utf-8") as f:
+            offset = int(f.read().strip() or 0)
+
+    entries = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while True:
+            line = f.readline()
+            if not line:
+                break
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn final line from a crash mid-append
+                print(f"[spool] Skipping unreadable entry at byte {f.tell()} of {path}")
+                continue
+            entries.append((entry, f.tell()))
+    return entries
+
+
+def run_write(entry: Dict[str, Any]) -> Optional[list]:
+    """Execute one spool entry against Supabase and return the written rows."""
+    query = get_supabase_client().table(entry["table"])
+    op = entry["op"]
+
+    if op == "insert":
+        query = query.insert(entry["payload"])
+    elif op == "upsert":
+        if entry.get("on_conflict"):
+            query = query.upsert(entry["payload"], on_conflict=entry["on_conflict"])
+        else:
+            query = query.upsert(entry["payload"])
+    elif op == "update":
+        query = query.update(entry["payload"])
+    elif op == "delete":
+        query = query.delete()
+    else:
+        raise ValueError(f"Unknown write op: {op}")
+
+    for column, value in (entry.get("match") or {}).items():
+        query = query.eq(column, value)
+
+    return query.execute().data
+
+
+class WriteSpool:
+    """
+    Durable write path for Supabase mutations.
+
+    Writes run directly while Supabase is healthy. When a write fails with a
+    transient error, or earlier writes are still waiting, it is appended to
+    an append-only JSON-lines file instead. A background thread replays the
+    file in order: consecutive inserts into the same table, and consecutive
+    upserts deduplicated on their conflict key, are sent as one request, and
+    failures back off exponentially. Replayed progress is tracked in a
+    sidecar offset file. Delivery is at-least-once: a crash between a
+    replayed write and the offset update repeats that write. Entries rejected
+    with a non-transient error go to a dead-letter file.
+
+    Every process spools to its own file (see process_spool_path) and holds
+    a lock on it while running. On start it also adopts the spool files of
+    processes that exited with writes still pending.
+    """
+
+    def __init__(
+        self, path: str, batch_size: int, max_backoff: float, pid: Optional[int] = None
+    ):
+        self.base_path = path
+        self.path = process_spool_path(path, pid or os.getpid())
+        self.offset_path = f"{self.path}.offset"
+        self.dead_letter_path = f"{self.path}.dead"
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+
+        self.replayed = 0
+        self.dead_lettered = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+        # (entry, byte offset just past the entry in the spool file)
+        self._pending: Deque[Tuple[Dict[str, Any], int]] = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._replayer: Optional[threading.Thread] = None
+        self._load()
+
+    def _load(self):
+        # Held for the life of the process, so no other process adopts this file
+        self._held_file = open(self.path, "ab")
+        _lock_file(self._held_file, blocking=True)
+        self._pending.extend(_read_spool(self.path))
+
+        root, ext = os.path.splitext(self.base_path)
+        pattern = re.compile(re.escape(root) + r"\.\d+" + re.escape(ext) + "$")
+        candidates = glob.glob(f"{glob.escape(root)}.*{ext}")
+        orphans = [p for p in candidates if pattern.match(p)]
+        if os.path.exists(self.base_path):
+            orphans.append(self.base_path)
+        for path in orphans:
+            if path != self.path:
+                self._adopt(path)
+
+    def _adopt(self, path: str):
+        """Move the pending entries of another process's spool into this one."""
+        try:
+            f = open(path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            if not _lock_file(f, blocking=False):
+                return  # Its process is still running
+            entries = _read_spool(path)
+            for entry, _ in entries:
+                self._append_locked(entry)
+            # Empty it while still locked; Windows can't delete an open file
+            f.truncate(0)
+            if os.path.exists(f"{path}.offset"):
+                os.remove(f"{path}.offset")
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        if entries:
+            print(f"[spool] Adopted {len(entries)} pending writes from {path}")
+
+    def start(self):
+        """Start the replay thread if it is not running yet."""
+        with self._lock:
+            if self._replayer is None:
+                self._replayer = threading.Thread(
+                    target=self._run_replayer, name="write-spool", daemon=True
+                )
+                self._replayer.start()
+        self._wakeup.set()
+
+    def write(
+        self,
+        table: str,
+        op: str,
+        payload: Any = None,
+        match: Optional[Dict[str, Any]] = None,
+        on_conflict: Optional[str] = None,
+    ) -> Optional[list]:
+        """
+        Run a write now, or spool it if Supabase is unavailable or earlier
+        writes are still spooled. Returns the written rows, or None if spooled.
+        Non-transient errors on the direct path are raised as before.
+        """
+        entry = {
+            "table": table,
+            "op": op,
+            "payload": payload,
+            "match": match or {},
+            "on_conflict": on_conflict,
+            "queued_at": time.time(),
+        }
+
+        # Decide and spool under one lock, so no write skips ahead of one
+        # that was spooled before it
+        with self._lock:
+            spooled = bool(self._pending)
+            if spooled:
+                self._append_locked(entry)
+
+        if not spooled:
+            try:
+                return run_write(entry)
+            except Exception as e:
+                if not is_transient_error(e):
+                    raise
+                print(f"[spool] Supabase unavailable, spooling {op} on {table}: {e}")
+            with self._lock:
+                self._append_locked(entry)
+
+        self.start()
+        return None
+
+    def _append_locked(self, entry: Dict[str, Any]):
+        """Append an entry to the spool file; caller holds _lock."""
+        line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            end = f.tell()
+        self._pending.append((entry, end))
+
+    @staticmethod
+    def _rows(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rows = entry["payload"]
+        return list(rows) if isinstance(rows, list) else [rows]
+
+    def _groups(
+        self, head: List[Tuple[Dict[str, Any], int]]
+    ) -> Iterator[Tuple[Dict[str, Any], List[Tuple[Dict[str, Any], int]]]]:
+        """
+        Yield (entry to run, the (entry, end offset) pairs it covers), merging
+        consecutive inserts into one table whose rows have the same columns,
+        and likewise upserts with a conflict key. A merged upsert keeps only
+        the last row per key, since Postgres rejects a statement that would
+        update the same row twice.
+        """
+        i = 0
+        while i < len(head):
+            entry = head[i][0]
+            members = [head[i]]
+            mergeable = not entry["match"] and (
+                entry["op"] == "insert"
+                or (entry["op"] == "upsert" and entry["on_conflict"])
+            )
+
+            if mergeable:
+                columns = {frozenset(row) for row in self._rows(entry)}
+                while i + len(members) < len(head):
+                    nxt = head[i + len(members)][0]
+                    if (
+                        nxt["table"] != entry["table"]
+                        or nxt["op"] != entry["op"]
+                        or nxt["on_conflict"] != entry["on_conflict"]
+                        or nxt["match"]
+                        or {frozenset(row) for row in self._rows(nxt)} | columns
+                        != columns
+                    ):
+                        break
+                    members.append(head[i + len(members)])
+
+            if len(members) > 1:
+                rows = [row for member, _ in members for row in self._rows(member)]
+                if entry["op"] == "upsert":
+                    key_columns = [c.strip() for c in entry["on_conflict"].split(",")]
+                    by_key: Dict[tuple, Dict[str, Any]] = {}
+                    for row in rows:
+                        key = tuple(str(row.get(c)) for c in key_columns)
+                        by_key.pop(key, None)
+                        by_key[key] = row
+                    rows = list(by_key.values())
+                entry = {**entry, "payload": rows}
+
+            yield entry, members
+            i += len(members)
+
+    def _commit(self, count: int, end: int):
+        with self._lock:
+            for _ in range(count):
+                self._pending.popleft()
+            self.replayed += count
+
+            if self._pending:
+                tmp_path = f"{self.offset_path}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(str(end))
+                os.replace(tmp_path, self.offset_path)
+            else:
+                # Fully drained: start a fresh spool file
+                open(self.path, "wb").close()
+                if os.path.exists(self.offset_path):
+                    os.remove(self.offset_path)
+
+    def _dead_letter(self, entry: Dict[str, Any], error: Exception):
+        print(f"[spool] Dropping {entry['op']} on {entry['table']}: {error}")
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({**entry, "error": str(error)}, default=str) + "\n")
+        self.dead_lettered += 1
+
+    def _run_or_dead_letter(self, entry: Dict[str, Any]):
+        try:
+            run_write(entry)
+        except Exception as e:
+            if is_transient_error(e):
+                raise
+            self._dead_letter(entry, e)
+
+    def _replay_once(self) -> bool:
+        with self._lock:
+            head = list(self._pending)[: self.batch_size]
+        if not head:
+            return False
+
+        for entry, members in self._groups(head):
+            if len(members) == 1:
+                self._run_or_dead_letter(entry)
+                self._commit(1, members[0][1])
+                continue
+
+            try:
+                run_write(entry)
+            except Exception as e:
+                if is_transient_error(e):
+                    raise
+                # One bad entry fails the whole batch: replay them one by one
+                for member, end in members:
+                    self._run_or_dead_letter(member)
+                    self._commit(1, end)
+                continue
+            self._commit(len(members), members[-1][1])
+        return True
+
+    def _run_replayer(self):
+        backoff = 1.0
+        while True:
+            self._wakeup.clear()
+            try:
+                if not self._replay_once():
+                    self._wakeup.wait()
+                backoff = 1.0
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                print(f"[spool] Replay failed, retrying in {backoff:.0f}s: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            depth = len(self._pending)
+            oldest = self._pending[0][0]["queued_at"] if self._pending else None
+        return {
+            "path": self.path,
+            "queue_depth": depth,
+            "replay_lag_seconds": time.time() - oldest if oldest else 0.0,
+            "replayed": self.replayed,
+            "dead_lettered": self.dead_lettered,
+            "replay_failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+_spool: Optional[WriteSpool] = None
+_spool_lock = threading.Lock()
+
+
+def get_write_spool() -> WriteSpool:
+    global _spool
+
+    with _spool_lock:
+        if _spool is None:
+            _spool = WriteSpool(
+                settings.WRITE_SPOOL_PATH,
+                batch_size=settings.WRITE_SPOOL_BATCH_SIZE,
+                max_backoff=settings.WRITE_SPOOL_MAX_BACKOFF_SECONDS,
+            )
+        return _spool
+
+
+def spooled_write(
+    table: str,
+    op: str,
+    payload: Any = None,
+    match: Optional[Dict[str, Any]] = None,
+    on_conflict: Optional[str] = None,
+) -> Optional[list]:
+    """Shortcut for get_write_spool().write(...)."""
+    return get_write_spool().write(
+        table, op, payload, match=match, on_conflict=on_conflict
+    )